@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# Thumbnail decoding benchmark on a synthetic folder of large film scans.
+#
+#   python bench/thumbnails.py [--count 8] [--width 8000] [--height 5300] [--folder PATH]
+#
+# Compares the former full size decode (QImage + scaled) with the reduced
+# decoding of ui.thumbnail_loader for plain JPEGs, JPEGs with an embedded
+# EXIF thumbnail, plain TIFFs and TIFFs with a reduced resolution page.
+
+import io
+import os
+import sys
+import time
+import struct
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from PyQt5.QtGui import QImage
+from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtWidgets import QApplication
+
+from ui.thumbnail_loader import load_thumbnail
+
+
+THUMB_SIZE = QSize(100, 100)
+
+
+
+def exif_with_thumbnail(thumb: bytes) -> bytes:
+    """ Minimal EXIF block: empty IFD0 followed by IFD1 with a JPEG thumbnail. """
+    ifd0 = struct.pack('<H', 0) + struct.pack('<I', 14)
+    ifd1_entries = 2
+    data_offset = 14 + 2 + ifd1_entries * 12 + 4
+    ifd1 = struct.pack('<H', ifd1_entries)
+    ifd1 += struct.pack('<HHII', 0x0201, 4, 1, data_offset)
+    ifd1 += struct.pack('<HHII', 0x0202, 4, 1, len(thumb))
+    ifd1 += struct.pack('<I', 0)
+    return b'Exif\x00\x00' + b'II*\x00' + struct.pack('<I', 8) + ifd0 + ifd1 + thumb
+
+
+def scan(width: int, height: int, seed: int) -> Image.Image:
+    """ Noisy gradient, compresses about as badly as a real scan. """
+    noise = Image.effect_noise((width // 4, height // 4), 40 + seed).resize((width, height))
+    gradient = Image.linear_gradient('L').resize((width, height))
+    return Image.merge('RGB', (noise, gradient, noise.transpose(Image.FLIP_LEFT_RIGHT)))
+
+
+def create_folder(folder: str, count: int, width: int, height: int):
+    for i in range(count):
+        img = scan(width, height, i)
+        img.save(os.path.join(folder, f'plain_{i:02d}.jpg'), quality=92)
+
+        small = img.copy()
+        small.thumbnail((160, 160))
+        buf = io.BytesIO()
+        small.save(buf, 'JPEG', quality=80)
+        img.save(os.path.join(folder, f'exif_{i:02d}.jpg'), quality=92, exif=exif_with_thumbnail(buf.getvalue()))
+
+        img.save(os.path.join(folder, f'plain_{i:02d}.tiff'))
+        preview = img.resize((width // 8, height // 8))
+        img.save(os.path.join(folder, f'pyramid_{i:02d}.tiff'), save_all=True, append_images=[preview])
+
+
+def bench(paths, load):
+    start = time.perf_counter()
+    for path in paths:
+        qimg = load(path)
+        assert not qimg.isNull(), path
+    return (time.perf_counter() - start) / len(paths) * 1000
+
+
+def full_decode(path: str) -> QImage:
+    return QImage(path).scaled(THUMB_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=8)
+    parser.add_argument('--width', type=int, default=8000)
+    parser.add_argument('--height', type=int, default=5300)
+    parser.add_argument('--folder', default=None, help='reuse an existing benchmark folder')
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    folder = args.folder or tempfile.mkdtemp(prefix='exifilm_bench_')
+    if not os.listdir(folder):
+        print(f"Creating {args.count} x 4 scans of {args.width}x{args.height} in {folder} ...")
+        create_folder(folder, args.count, args.width, args.height)
+
+    files = sorted(os.listdir(folder))
+    print(f"{'files':<10} {'count':>5} {'full decode':>14} {'reduced':>14} {'speedup':>8}")
+    for prefix in ('plain_', 'exif_', 'pyramid_'):
+        for ext in ('.jpg', '.tiff'):
+            paths = [os.path.join(folder, f) for f in files if f.startswith(prefix) and f.endswith(ext)]
+            if not paths:
+                continue
+            full = bench(paths, full_decode)
+            reduced = bench(paths, lambda p: load_thumbnail(p, THUMB_SIZE))
+            name = prefix + ext.lstrip('.')
+            print(f"{name:<10} {len(paths):>5} {full:>11.1f} ms {reduced:>11.1f} ms {full / reduced:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
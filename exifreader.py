@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+
+import os
+import mmap
+import struct
+from typing import Any, Dict, Iterable, Optional
+
+from PIL.TiffImagePlugin import IFDRational
+
+from util import *
+
+
+# Tags needed to sort, filter and apply roll data
+METADATA_TAGS = {
+    ExifTagNames.Shutter.value,         # ExposureTime
+    ExifTagNames.Aperture.value,        # FNumber
+    ExifTagNames.ISO.value,
+    ExifTagNames.FocalLength.value,
+    0x9003,                             # DateTimeOriginal
+    ExifTagNames.Make.value,
+    ExifTagNames.Model.value,
+}
+
+EXIF_IFD_POINTER = 0x8769
+
+# TIFF field type -> (struct format, size in bytes)
+FIELD_TYPES = {
+    1:  ('B', 1),       # BYTE
+    2:  ('s', 1),       # ASCII
+    3:  ('H', 2),       # SHORT
+    4:  ('L', 4),       # LONG
+    5:  ('LL', 8),      # RATIONAL
+    6:  ('b', 1),       # SBYTE
+    7:  ('s', 1),       # UNDEFINED
+    8:  ('h', 2),       # SSHORT
+    9:  ('l', 4),       # SLONG
+    10: ('ll', 8),      # SRATIONAL
+    11: ('f', 4),       # FLOAT
+    12: ('d', 8),       # DOUBLE
+}
+
+# JPEG markers without a length field
+_STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+_SOS  = 0xDA
+_APP1 = 0xE1
+
+
+
+class ExifFormatError(Exception):
+    pass
+
+
+
+def _decode_value(buf, tiff: int, endian: str, typ: int, count: int, value_offset: int) -> Any:
+    """ Decode one IFD entry the same way Pillow does. """
+    fmt, size = FIELD_TYPES[typ]
+    length = size * count
+    if length <= 4:
+        start = value_offset
+    else:
+        start = tiff + struct.unpack_from(endian + 'L', buf, value_offset)[0]
+    if start + length > len(buf):
+        raise ExifFormatError("value outside of file")
+    data = buf[start:start + length]
+
+    if typ == 2:
+        data = bytes(data)
+        if data.endswith(b'\0'):
+            data = data[:-1]
+        return data.decode('latin-1', 'replace')
+    if typ == 7:
+        return bytes(data)
+
+    values = struct.unpack(endian + fmt * count, data)
+    if typ in (5, 10):
+        values = tuple(IFDRational(n, d) for n, d in zip(values[::2], values[1::2]))
+    return values[0] if len(values) == 1 else values
+
+
+def _read_ifd(buf, tiff: int, offset: int, endian: str, tags: set, result: Dict[int, Any]) -> Optional[int]:
+    """ Decode the requested tags of one IFD, returns the ExifIFD offset if present. """
+    pos = tiff + offset
+    if pos + 2 > len(buf):
+        raise ExifFormatError("IFD outside of file")
+    count = struct.unpack_from(endian + 'H', buf, pos)[0]
+    if pos + 2 + count * 12 > len(buf):
+        raise ExifFormatError("IFD outside of file")
+
+    exif_ifd = None
+    for i in range(count):
+        entry = pos + 2 + i * 12
+        tag, typ, n = struct.unpack_from(endian + 'HHL', buf, entry)
+        if tag == EXIF_IFD_POINTER:
+            exif_ifd = struct.unpack_from(endian + 'L', buf, entry + 8)[0]
+        elif tag in tags and typ in FIELD_TYPES:
+            try:
+                result[tag] = _decode_value(buf, tiff, endian, typ, n, entry + 8)
+            except (ExifFormatError, struct.error) as e:
+                logger.debug(f"Skipping EXIF tag {tag:#06x}: {e}")
+    return exif_ifd
+
+
+def _read_tiff(buf, tiff: int, tags: set) -> Dict[int, Any]:
+    """ Tags from IFD0 and the ExifIFD of the TIFF structure starting at `tiff`. """
+    order = bytes(buf[tiff:tiff + 2])
+    if order == b'II':
+        endian = '<'
+    elif order == b'MM':
+        endian = '>'
+    else:
+        raise ExifFormatError("no TIFF header")
+    magic, ifd0 = struct.unpack_from(endian + 'HL', buf, tiff + 2)
+    if magic != 42:
+        raise ExifFormatError("not a classic TIFF")
+
+    result = {}
+    exif_ifd = _read_ifd(buf, tiff, ifd0, endian, tags, result)
+    if exif_ifd and tags - result.keys():
+        _read_ifd(buf, tiff, exif_ifd, endian, tags, result)
+    return result
+
+
+def _find_jpeg_exif(buf) -> Optional[int]:
+    """ Offset of the TIFF header inside the APP1 Exif segment, None if there is none. """
+    pos, end = 2, len(buf)
+    while pos + 4 <= end:
+        if buf[pos] != 0xFF:
+            raise ExifFormatError("JPEG marker expected")
+        marker = buf[pos + 1]
+        if marker == 0xFF:                  # fill byte
+            pos += 1
+            continue
+        if marker in _STANDALONE_MARKERS:
+            pos += 2
+            continue
+        if marker == _SOS:                  # image data follows, no more metadata
+            return None
+        length = struct.unpack_from('>H', buf, pos + 2)[0]
+        if marker == _APP1 and buf[pos + 4:pos + 10] == b'Exif\0\0':
+            return pos + 10
+        pos += 2 + length
+    return None
+
+
+def read_metadata(path: str, tags: Iterable[int]=METADATA_TAGS) -> Optional[Dict[int, Any]]:
+    """
+    Read selected EXIF tags of a JPEG or TIFF file without decoding the image.
+
+    Only the APP1 segment or the TIFF IFDs are touched, through a memory map,
+    and only the requested tags are decoded (MakerNotes and other large
+    blobs are skipped). Values have the same types as Pillow's.
+    Returns None for other file formats.
+    """
+    tags = set(tags)
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < 8:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            buf = memoryview(mm)
+            try:
+                head = bytes(buf[:4])
+                if head[:2] == b'\xFF\xD8':
+                    tiff = _find_jpeg_exif(buf)
+                    return {} if tiff is None else _read_tiff(buf, tiff, tags)
+                if head in (b'II*\0', b'MM\0*'):
+                    return _read_tiff(buf, 0, tags)
+                return None
+            except (ExifFormatError, struct.error) as e:
+                logger.debug(f"Broken EXIF in {path}: {e}")
+                return {}
+            finally:
+                buf.release()
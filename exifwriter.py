@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+#
+# EXIF tag writer for JPEG and TIFF files.
+#
+# Tags are changed in the TIFF structure that holds them - the APP1 segment
+# of a JPEG or the IFDs of a TIFF - and nothing else of the file is decoded
+# or moved. A value that fits into the slot of the old one is written over
+# it. Otherwise the whole IFD is written again at the end of the structure
+# and the single offset pointing to it is updated; entries that did not
+# change keep pointing to their old data, so MakerNotes, the IFD1 thumbnail
+# and image strips stay where they are.
+#
+# JPEGs get a new APP1 segment in a copy of the file. TIFFs are patched in
+# place: values that do not fit into the old slot are appended, and any data
+# is on disk before the count and offset of an entry, or the offset of a new
+# IFD, are changed to point to it. Each of these is a single small write, so
+# the count of an entry never exceeds the data it points to. Values whose
+# bytes did not change are not written at all, saving the same tags again
+# leaves the file as it is.
+
+import io
+import os
+import mmap
+import shutil
+import struct
+from fractions import Fraction
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from util import *
+from exifreader import EXIF_IFD_POINTER, FIELD_TYPES, ExifFormatError
+
+
+# TIFF type of tags EXIFilm writes, used when a tag is not in the file yet
+TAG_TYPES = {
+    ExifTagNames.Make.value:         2,     # ASCII
+    ExifTagNames.Model.value:        2,
+    ExifTagNames.Shutter.value:      5,     # RATIONAL
+    ExifTagNames.Aperture.value:     5,
+    ExifTagNames.ISO.value:          3,     # SHORT
+    ExifTagNames.FocalLength.value:  5,
+    ExifTagNames.ImageNumber.value:  4,     # LONG
+    0x9003:                          2,     # DateTimeOriginal
+}
+
+# tags of IFD0, everything else belongs to the Exif IFD
+IFD0_TAGS = {
+    ExifTagNames.Make.value,
+    ExifTagNames.Model.value,
+}
+
+# largest denominator of rationals written for float values
+MAX_DENOMINATOR = 1000000
+
+# JPEG markers
+_SOI  = 0xD8
+_SOS  = 0xDA
+_APP0 = 0xE0
+_APP1 = 0xE1
+_STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+EXIF_HEADER = b'Exif\0\0'
+# payload of an APP1 segment, its length field counts itself
+MAX_SEGMENT = 0xFFFF - 2
+
+
+
+class IfdEntry:
+    """ One 12 byte IFD entry, `pos` is its offset from the TIFF header. """
+    def __init__(self, tag: int, typ: int, count: int, value: bytes, pos: int=-1):
+        self.tag = tag
+        self.typ = typ
+        self.count = count
+        self.value = value      # the 4 byte value field, the value itself or an offset
+        self.pos = pos
+
+    def size(self) -> int:
+        return FIELD_TYPES[self.typ][1] * self.count if self.typ in FIELD_TYPES else 0
+
+
+
+class TiffPatcher:
+    """
+    Changes tags of IFD0 and the Exif IFD of a TIFF structure that starts
+    at `base` in a seekable, writable file. New data is appended at `end`,
+    which defaults to the end of the file. With `in_place` the file is
+    synced before an offset is changed to point to appended data.
+    Tags whose value cannot be stored are skipped and kept in `skipped`
+    with the reason.
+    """
+    def __init__(self, f: BinaryIO, base: int=0, end: Optional[int]=None, in_place: bool=False):
+        self.f = f
+        self.base = base
+        self.in_place = in_place
+        self.skipped: Dict[int, str] = {}
+        if end is None:
+            end = f.seek(0, os.SEEK_END)
+        self.end = end
+
+        order = self.read(0, 2)
+        if order == b'II':
+            self.endian = '<'
+        elif order == b'MM':
+            self.endian = '>'
+        else:
+            raise ExifFormatError("no TIFF header")
+        magic, self.ifd0 = struct.unpack(self.endian + 'HL', self.read(2, 6))
+        if magic != 42:
+            raise ExifFormatError("not a classic TIFF")
+
+
+    def read(self, offset: int, size: int) -> bytes:
+        self.f.seek(self.base + offset)
+        data = self.f.read(size)
+        if len(data) != size:
+            raise ExifFormatError("offset outside of file")
+        return data
+
+
+    def write(self, offset: int, data: bytes):
+        self.f.seek(self.base + offset)
+        self.f.write(data)
+
+
+    def sync(self):
+        if self.in_place:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+
+
+    def read_ifd(self, offset: int) -> Tuple[Dict[int, IfdEntry], int]:
+        """ Entries of the IFD at `offset` and the offset of the next IFD. """
+        count = struct.unpack(self.endian + 'H', self.read(offset, 2))[0]
+        raw = self.read(offset + 2, count * 12 + 4)
+        entries = {}
+        for i in range(count):
+            tag, typ, n = struct.unpack_from(self.endian + 'HHL', raw, i * 12)
+            entries[tag] = IfdEntry(tag, typ, n, raw[i * 12 + 8:i * 12 + 12], offset + 2 + i * 12)
+        return entries, struct.unpack_from(self.endian + 'L', raw, count * 12)[0]
+
+
+    def encode(self, typ: int, val: Any) -> Tuple[int, bytes]:
+        """ (count, bytes) of a value as TIFF type `typ`, ValueError if it cannot be stored. """
+        if typ == 2:
+            data = str(val).encode('utf-8') + b'\0'
+            return len(data), data
+        if typ == 7:
+            data = val if isinstance(val, bytes) else str(val).encode('utf-8')
+            return len(data), data
+        values = val if isinstance(val, (tuple, list)) else (val,)
+        if typ in (3, 4):
+            ints = [int(Fraction(v)) if isinstance(v, str) else int(v) for v in values]
+            return len(ints), struct.pack(self.endian + FIELD_TYPES[typ][0] * len(ints), *ints)
+        if typ == 5:
+            nums = []
+            for v in values:
+                if hasattr(v, 'numerator') and hasattr(v, 'denominator') and not isinstance(v, float):
+                    frac = (int(v.numerator), int(v.denominator))
+                else:
+                    # raises ValueError for nan, OverflowError for inf
+                    try:
+                        f = Fraction(v).limit_denominator(MAX_DENOMINATOR)
+                    except OverflowError:
+                        raise ValueError(f"{v} is not a rational number")
+                    frac = (f.numerator, f.denominator)
+                if frac[0] < 0 or frac[1] <= 0:
+                    raise ValueError(f"{v} is not a positive rational number")
+                nums.extend(frac)
+            return len(values), struct.pack(self.endian + 'LL' * len(values), *nums)
+        raise ValueError(f"TIFF type {typ} is not supported")
+
+
+    def append(self, data: bytes) -> int:
+        """ Write `data` at the end, word aligned, returns its offset. """
+        offset = self.end + (self.end & 1)
+        if offset + len(data) > 0xFFFFFFFF:
+            raise ExifFormatError("TIFF offsets are limited to 4 GB")
+        self.write(self.end, b'\0' * (offset - self.end) + data)
+        self.end = offset + len(data)
+        return offset
+
+
+    def append_ifd(self, entries: List[IfdEntry], data: Dict[int, bytes], next_ifd: int) -> int:
+        """ Write an IFD and the data of new entries that do not fit into 4 bytes, returns its offset. """
+        for entry in entries:
+            if entry.tag in data:
+                value = data[entry.tag]
+                if len(value) > 4:
+                    entry.value = struct.pack(self.endian + 'L', self.append(value))
+                else:
+                    entry.value = value.ljust(4, b'\0')
+        raw = struct.pack(self.endian + 'H', len(entries))
+        for entry in sorted(entries, key=lambda e: e.tag):
+            raw += struct.pack(self.endian + 'HHL', entry.tag, entry.typ, entry.count) + entry.value
+        raw += struct.pack(self.endian + 'L', next_ifd)
+        return self.append(raw)
+
+
+    def value_bytes(self, entry: IfdEntry) -> bytes:
+        """ Current value of an entry as stored, inline or at its offset. """
+        size = entry.size()
+        if size <= 4:
+            return entry.value[:size]
+        return self.read(struct.unpack(self.endian + 'L', entry.value)[0], size)
+
+
+    def patch_ifd(self, entries: Dict[int, IfdEntry], updates: Dict[int, Any]) -> Dict[int, bytes]:
+        """
+        Write updated values into their existing entries where they fit,
+        unchanged values are skipped. Values longer than 4 bytes are written
+        over the old value if that is at least as long. In place, longer ones
+        are appended; the data is synced before the entries are changed to
+        point to it. Other new entries are changed in `entries` only and
+        their data is returned, the IFD has to be written again for them.
+        """
+        moved = {}
+        patched = []
+        written = False
+        for tag, val in updates.items():
+            entry = entries.get(tag)
+            typ = entry.typ if entry and entry.typ in (2, 3, 4, 5, 7) else TAG_TYPES.get(tag)
+            if typ is None:
+                logger.debug(f"EXIF tag {tag:#06x} is not written, its type is unknown")
+                self.skipped[tag] = "its type is unknown"
+                continue
+            try:
+                count, data = self.encode(typ, val)
+            except (ValueError, TypeError, struct.error) as e:
+                logger.warning(f"EXIF tag {tag:#06x} is not written: {e}")
+                self.skipped[tag] = str(e)
+                continue
+
+            if entry and entry.typ == typ and (len(data) <= 4 or self.in_place or
+                                              len(data) <= entry.size() and entry.size() > 4):
+                if count == entry.count and data == self.value_bytes(entry):
+                    continue
+                if len(data) <= 4:
+                    entry.value = data.ljust(4, b'\0')
+                elif len(data) <= entry.size() and entry.size() > 4:
+                    # with the old count the entry still covers valid bytes of the slot
+                    self.write(struct.unpack(self.endian + 'L', entry.value)[0], data)
+                    written = True
+                else:
+                    # the old value stays intact until the entry points to the new one
+                    entry.value = struct.pack(self.endian + 'L', self.append(data))
+                    written = True
+                entry.count = count
+                patched.append(entry)
+            else:
+                entries[tag] = IfdEntry(tag, typ, count, b'\0' * 4)
+                moved[tag] = data
+
+        if written:
+            self.sync()
+        for entry in patched:
+            # count and value or offset of an entry in a single write
+            self.write(entry.pos + 4, struct.pack(self.endian + 'L', entry.count) + entry.value)
+        return moved
+
+
+    def update(self, updates: Dict[int, Any]):
+        ifd0, next_ifd = self.read_ifd(self.ifd0)
+        ifd0_updates = {t: v for t, v in updates.items() if t in IFD0_TAGS}
+        exif_updates = {t: v for t, v in updates.items() if t not in IFD0_TAGS}
+
+        if exif_updates:
+            pointer = ifd0.get(EXIF_IFD_POINTER)
+            if pointer:
+                exif_offset = struct.unpack(self.endian + 'L', pointer.value)[0]
+                exif_ifd, exif_next = self.read_ifd(exif_offset)
+            else:
+                exif_ifd, exif_next = {}, 0
+            moved = self.patch_ifd(exif_ifd, exif_updates)
+            if moved or not pointer:
+                exif_offset = self.append_ifd(list(exif_ifd.values()), moved, exif_next)
+                value = struct.pack(self.endian + 'L', exif_offset)
+                if pointer:
+                    # the only change outside of the new IFD
+                    self.sync()
+                    self.write(pointer.pos + 8, value)
+                    pointer.value = value
+                else:
+                    ifd0[EXIF_IFD_POINTER] = IfdEntry(EXIF_IFD_POINTER, 4, 1, value)
+
+        moved = self.patch_ifd(ifd0, ifd0_updates)
+        if moved or any(entry.pos < 0 for entry in ifd0.values()):
+            offset = self.append_ifd(list(ifd0.values()), moved, next_ifd)
+            self.sync()
+            self.write(4, struct.pack(self.endian + 'L', offset))
+
+
+
+def _jpeg_segments(buf) -> Tuple[Optional[Tuple[int, int]], int]:
+    """ (start, end) of the APP1 Exif segment or None, and where a new one is inserted. """
+    if buf[0] != 0xFF or buf[1] != _SOI:
+        raise ExifFormatError("not a JPEG file")
+    pos, end = 2, len(buf)
+    insert = 2
+    while pos + 4 <= end:
+        if buf[pos] != 0xFF:
+            raise ExifFormatError("JPEG marker expected")
+        marker = buf[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in _STANDALONE_MARKERS:
+            pos += 2
+            continue
+        if marker == _SOS:
+            break
+        length = struct.unpack_from('>H', buf, pos + 2)[0]
+        if marker == _APP1 and buf[pos + 4:pos + 10] == EXIF_HEADER:
+            return (pos, pos + 2 + length), insert
+        if marker == _APP0 and insert == pos:
+            # JFIF and JFXX segments have to stay first
+            insert = pos + 2 + length
+        pos += 2 + length
+    return None, insert
+
+
+def _write_jpeg(path: str, updates: Dict[int, Any]) -> Dict[int, str]:
+    """ Rewrite the APP1 segment, every other byte is copied as it is. """
+    with open(path, 'rb') as src:
+        with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            segment, insert = _jpeg_segments(mm)
+            if segment:
+                start, end = segment
+                tiff = bytearray(mm[start + 10:end])
+            else:
+                start = end = insert
+                tiff = bytearray(b'II*\0\x08\0\0\0\0\0\0\0\0\0')
+
+
+    block = io.BytesIO(tiff)
+    patcher = TiffPatcher(block)
+    patcher.update(updates)
+    payload = EXIF_HEADER + block.getvalue()
+    if len(payload) > MAX_SEGMENT:
+        raise ExifFormatError("EXIF data does not fit into a JPEG segment")
+
+    # the source is closed before the copy replaces it
+    with atomic_write(path, 'wb') as dst:
+        with open(path, 'rb') as src:
+            dst.write(src.read(start))
+            dst.write(struct.pack('>BBH', 0xFF, _APP1, len(payload) + 2) + payload)
+            src.seek(end)
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+    return patcher.skipped
+
+
+def _write_tiff(path: str, updates: Dict[int, Any]) -> Dict[int, str]:
+    """
+    Patch the IFDs in place, only changed slots and the data appended
+    at the end are written, whatever the size of the image data.
+    """
+    with open(path, 'r+b') as f:
+        patcher = TiffPatcher(f, in_place=True)
+        patcher.update(updates)
+        f.flush()
+        os.fsync(f.fileno())
+    return patcher.skipped
+
+
+def write_exif(path: str, updates: Dict[int, Any]) -> Dict[int, str]:
+    """
+    Write EXIF tags of a JPEG or TIFF file without touching its image data.
+    JPEGs are replaced atomically, TIFFs patched in place. Raises ExifFormatError for other
+    formats and broken files. Tags whose value cannot be stored are skipped,
+    they are returned with the reason.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    if head[:2] == b'\xFF\xD8':
+        return _write_jpeg(path, updates)
+    elif head in (b'II*\0', b'MM\0*'):
+        return _write_tiff(path, updates)
+    else:
+        raise ExifFormatError("EXIF data can only be written to JPEG and TIFF files")
@@ -500,4 +500,4 @@ def decode_roll_data(raw: bytes, frame_sz:int, model="F90x") -> RollData:
                 # ExifTagNames.FlashCompensation: parse_flash_compensation(frame[5])
             })
     
-    return RollData(roll_number, iso, frames)
+    return RollData(roll_number, iso, frames, frame_size=frame_sz, raw=bytes(payload))
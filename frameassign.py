@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+#
+
+import os
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from util import *
+from rolldata import *
+
+
+ASSIGN_BY_ORDER    = 'order'
+ASSIGN_BY_FILENAME = 'filename'
+
+_NUMBER_RE = re.compile(r'\d+')
+
+
+
+def parse_frame_list(text: str) -> Set[int]:
+    """ Parse frame numbers like "1, 5-7, 12" into a set. """
+    frames = set()
+    for part in text.replace(';', ',').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            frames.update(range(int(start), int(end) + 1))
+        else:
+            frames.add(int(part))
+    return frames
+
+
+def frame_number_from_name(path: str) -> Optional[int]:
+    """ Frame number in a file name, taken from the last group of digits. """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    numbers = _NUMBER_RE.findall(stem)
+    return int(numbers[-1]) if numbers else None
+
+
+def assign_frames(roll: RollData, paths: List[str], mode: str=ASSIGN_BY_ORDER,
+                  offset: int=0, skip: Set[int]=set()) -> List[Tuple[int, Dict[int, Any]]]:
+    """
+    Map the frames of a roll onto images.
+
+    ASSIGN_BY_ORDER pairs the images in the given order with the frames that
+    are not skipped, starting `offset` frames later (or earlier if negative).
+    ASSIGN_BY_FILENAME gives every image the frame whose number is found in
+    its file name, plus `offset`.
+
+    Returns (image index, EXIF update) pairs for all images with a frame.
+    """
+    frames = [f for f in roll.frames if f.get(ExifTagNames.ImageNumber) not in skip]
+    result = []
+
+    if mode == ASSIGN_BY_FILENAME:
+        by_number = {f.get(ExifTagNames.ImageNumber): f for f in frames}
+        for i, path in enumerate(paths):
+            number = frame_number_from_name(path)
+            if number is None:
+                continue
+            frame = by_number.get(number + offset)
+            if frame is not None:
+                result.append((i, frame_exif(roll, frame)))
+        return result
+
+    for i in range(len(paths)):
+        j = i + offset
+        if 0 <= j < len(frames):
+            result.append((i, frame_exif(roll, frames[j])))
+    return result
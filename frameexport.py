@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+
+import os
+import csv
+import json
+import math
+from typing import Any, Dict, Iterable, Iterator
+
+from util import *
+from rolldata import *
+
+
+# Frame level dataset: one record per frame, prefixed by the roll metadata
+ROLL_FIELDS = ['roll_number', 'roll_iso', 'roll_description']
+
+FRAME_FIELDS = [
+    ExifTagNames.ImageNumber,
+    ExifTagNames.Shutter,
+    ExifTagNames.Aperture,
+    ExifTagNames.FocalLength,
+    ExifTagNames.ISO,
+    ExifTagNames.ExposureMode,
+    ExifTagNames.MeteringMode,
+    ExifTagNames.Flash,
+    ExifTagNames.Make,
+    ExifTagNames.Model,
+]
+
+FIELD_NAMES = ROLL_FIELDS + [tag.name for tag in FRAME_FIELDS]
+
+
+
+def iter_frame_records(rolls: Iterable[RollData]) -> Iterator[Dict[str, Any]]:
+    """
+    Yield one flat record per frame of all rolls.
+
+    `rolls` may be any iterable, e.g. a RollArchive, so only a single roll
+    has to be in memory at a time. Values that are not finite, like the
+    NaN focal length of lenses without a CPU, are None.
+    """
+    for roll in rolls:
+        for frame in roll.frames:
+            record = {
+                'roll_number':      roll.roll_number,
+                'roll_iso':         roll.iso,
+                'roll_description': roll.desc,
+            }
+            for tag in FRAME_FIELDS:
+                val = frame.get(tag)
+                record[tag.name] = None if isinstance(val, float) and not math.isfinite(val) else val
+            yield record
+
+
+def export_jsonl(filename: str, rolls: Iterable[RollData], append: bool=False) -> int:
+    """ Write all frames as JSON Lines, returns the number of frames written. """
+    count = 0
+    with open(filename, 'a' if append else 'w', encoding='utf-8') as f:
+        for record in iter_frame_records(rolls):
+            f.write(json.dumps(record, allow_nan=False))
+            f.write('\n')
+            count += 1
+    logger.debug(f"Exported {count} frames to {filename}")
+    return count
+
+
+def export_flat_csv(filename: str, rolls: Iterable[RollData], append: bool=False) -> int:
+    """
+    Write all frames into one CSV file, returns the number of frames written.
+    When appending, the header is only written if the file is new or empty.
+    """
+    write_header = not append or not os.path.exists(filename) or os.path.getsize(filename) == 0
+    count = 0
+    with open(filename, 'a' if append else 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELD_NAMES, lineterminator='\n')
+        if write_header:
+            writer.writeheader()
+        for record in iter_frame_records(rolls):
+            writer.writerow(record)
+            count += 1
+    logger.debug(f"Exported {count} frames to {filename}")
+    return count
+
+
+def export_frames(filename: str, rolls: Iterable[RollData], append: bool=False) -> int:
+    """ Export to JSON Lines or CSV, depending on the file extension. """
+    if filename.lower().endswith('.csv'):
+        return export_flat_csv(filename, rolls, append)
+    return export_jsonl(filename, rolls, append)
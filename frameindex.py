@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+#
+
+import re
+import math
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from util import *
+from rolldata import *
+
+
+# column name, EXIF tag (None for the roll number), formatter
+INDEX_COLUMNS = [
+    ("Roll",         None,                      str),
+    ("Frame",        ExifTagNames.ImageNumber,  lambda v: f"{v:02d}"),
+    ("Shutter",      ExifTagNames.Shutter,      format_exposure_time),
+    ("Aperture",     ExifTagNames.Aperture,     format_aperture),
+    ("Focal Length", ExifTagNames.FocalLength,  format_focal_length),
+    ("ISO",          ExifTagNames.ISO,          str),
+    ("Exp. Mode",    ExifTagNames.ExposureMode, str),
+    ("Metering",     ExifTagNames.MeteringMode, str),
+    ("Flash Sync",   ExifTagNames.Flash,        str),
+    ("Model",        ExifTagNames.Model,        str),
+]
+
+# names accepted in filter expressions, mapped to the column index
+FILTER_ALIASES = {
+    'roll': 0,
+    'frame': 1, '#': 1,
+    'shutter': 2, 'speed': 2, 'exposure time': 2, 'time': 2,
+    'aperture': 3, 'fnumber': 3, 'f/': 3, 'f': 3,
+    'focal length': 4, 'focal': 4, 'fl': 4,
+    'iso': 5,
+    'exposure mode': 6, 'exp. mode': 6, 'mode': 6,
+    'metering mode': 7, 'metering': 7,
+    'flash sync': 8, 'flash': 8,
+    'model': 9,
+}
+
+OPERATORS = {
+    '>=': lambda a, b: a >= b, '≥': lambda a, b: a >= b,
+    '<=': lambda a, b: a <= b, '≤': lambda a, b: a <= b,
+    '!=': lambda a, b: not _equal(a, b), '≠': lambda a, b: not _equal(a, b),
+    '==': lambda a, b: _equal(a, b), '=': lambda a, b: _equal(a, b),
+    '>':  lambda a, b: a > b,
+    '<':  lambda a, b: a < b,
+}
+
+_OP_RE    = re.compile(r'^(>=|<=|!=|==|=|>|<|≥|≤|≠)?\s*(.*)$')
+_SPLIT_RE = re.compile(r'\s+and\s+|\s*,\s*|\s*&&?\s*', re.IGNORECASE)
+
+
+
+def _equal(a: Any, b: Any) -> bool:
+    if isinstance(a, float) or isinstance(b, float):
+        return math.isclose(a, b, rel_tol=1e-3)
+    return a == b
+
+
+def _is_number(val: Any) -> bool:
+    return isinstance(val, (int, float)) and not (isinstance(val, float) and math.isnan(val))
+
+
+def parse_number(text: str) -> Optional[float]:
+    """ Parse filter values like '400', '85mm', 'f/5.6', '1/250' or '2s'. """
+    text = text.strip().lower()
+    text = text.removeprefix('f/').removesuffix('mm').removesuffix('s').strip()
+    try:
+        if '/' in text:
+            num, den = text.split('/', 1)
+            return float(num) / float(den)
+        return float(text)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+
+class FrameFilter:
+    """
+    One term of a filter expression.
+
+    `column` is None for free text terms, which match anywhere in the row.
+    """
+    def __init__(self, text: str, column: Optional[int]=None, op: str='=', value: Any=None):
+        self.text   = text
+        self.column = column
+        self.op     = op
+        self.value  = value
+
+    def predicate(self) -> Callable[[Any], bool]:
+        compare, value = OPERATORS[self.op], self.value
+        if isinstance(value, float):
+            return lambda v: _is_number(v) and compare(v, value)
+        # text values match case insensitive substrings for (not) equal
+        if self.op in ('=', '==', '!=', '≠'):
+            negate = self.op in ('!=', '≠')
+            return lambda v: (value in str(v).lower()) != negate
+        return lambda v: compare(str(v).lower(), value)
+
+
+def parse_filter(text: str) -> Tuple[List[FrameFilter], List[str]]:
+    """
+    Parse a filter expression like "ISO 400 and focal length >= 85".
+
+    Terms are separated by 'and', ',' or '&'. A term starting with a column
+    name compares that column, anything else is searched as free text.
+    Incomplete terms (e.g. "iso >=" while typing) are skipped.
+    Returns the filters and a list of error messages.
+    """
+    filters, errors = [], []
+    for term in _SPLIT_RE.split(text.strip()):
+        term = term.strip().lower()
+        if not term:
+            continue
+
+        column, rest = None, term
+        for alias in sorted(FILTER_ALIASES, key=len, reverse=True):
+            if term.startswith(alias) and (len(term) == len(alias) or not alias[-1].isalnum()
+                                           or not term[len(alias)].isalnum()):
+                column, rest = FILTER_ALIASES[alias], term[len(alias):].strip()
+                break
+
+        if column is None:
+            filters.append(FrameFilter(term, value=term))
+            continue
+
+        op, value = _OP_RE.match(rest).groups()
+        if not value:
+            continue
+        op = op or '='
+        number = parse_number(value)
+        if number is not None:
+            filters.append(FrameFilter(term, column, op, number))
+        elif op in ('=', '==', '!=', '≠'):
+            filters.append(FrameFilter(term, column, op, value))
+        else:
+            errors.append(f"'{value}' is not a number")
+    return filters, errors
+
+
+
+class FrameIndex:
+    """
+    Column oriented index over the frames of many rolls.
+
+    Every column is a plain list with one value per frame, so filters and
+    sort keys are evaluated on whole columns instead of per table cell.
+    Display strings, row texts and sort keys are built lazily and cached.
+    """
+    def __init__(self, rolls: List[RollData]):
+        self.rolls = rolls
+        self.refs: List[Tuple[int, int]] = []      # row -> (roll index, frame index)
+        self.columns: List[List[Any]] = [[] for _ in INDEX_COLUMNS]
+
+        for r, roll in enumerate(rolls):
+            for f, frame in enumerate(roll.frames):
+                self.refs.append((r, f))
+                self.columns[0].append(roll.roll_number)
+                for c, (_, tag, _) in enumerate(INDEX_COLUMNS[1:], 1):
+                    self.columns[c].append(frame.get(tag))
+
+        self._display: Dict[int, List[Optional[str]]] = {}
+        self._sort_keys: Dict[int, List[Any]] = {}
+        self._row_text: Optional[List[str]] = None
+        # filter results keyed by the terms evaluated so far
+        self._matches: Dict[Tuple[str, ...], List[int]] = {}
+
+    def __len__(self):
+        return len(self.refs)
+
+    def frame(self, row: int) -> Tuple[RollData, Dict[Any, Any]]:
+        r, f = self.refs[row]
+        return self.rolls[r], self.rolls[r].frames[f]
+
+    def display(self, row: int, column: int) -> str:
+        cache = self._display.get(column)
+        if cache is None:
+            cache = self._display[column] = [None] * len(self.refs)
+        text = cache[row]
+        if text is None:
+            val = self.columns[column][row]
+            if val is None:
+                text = "Unknown"
+            else:
+                try:
+                    text = INDEX_COLUMNS[column][2](val)
+                except Exception:
+                    text = str(val)
+            cache[row] = text
+        return text
+
+    def sort_keys(self, column: int) -> List[Any]:
+        keys = self._sort_keys.get(column)
+        if keys is None:
+            keys = self._sort_keys[column] = [sort_key(v) for v in self.columns[column]]
+        return keys
+
+    def row_text(self) -> List[str]:
+        if self._row_text is None:
+            self._row_text = [
+                ' '.join(self.display(row, c) for c in range(len(INDEX_COLUMNS))).lower()
+                for row in range(len(self.refs))
+            ]
+        return self._row_text
+
+    def filter(self, filters: List[FrameFilter]) -> List[int]:
+        """
+        Rows matching all filters, in index order.
+
+        Each term only looks at the rows left by the terms before it, and
+        the intermediate results are cached, so typing a further term only
+        evaluates that term.
+        """
+        rows = list(range(len(self.refs)))
+        key: Tuple[str, ...] = ()
+        for flt in filters:
+            key += (flt.text,)
+            cached = self._matches.get(key)
+            if cached is not None:
+                rows = cached
+                continue
+
+            pred = flt.predicate()
+            values = self.row_text() if flt.column is None else self.columns[flt.column]
+            rows = [row for row in rows if pred(values[row])]
+            self._matches[key] = rows
+
+        # only keep results the current expression can build on
+        self._matches = {k: v for k, v in self._matches.items() if key[:len(k)] == k}
+        return rows
+
+    def sort(self, rows: List[int], column: int, descending: bool=False) -> List[int]:
+        keys = self.sort_keys(column)
+        return sorted(rows, key=keys.__getitem__, reverse=descending)
@@ -9,17 +9,26 @@ from PyQt5.QtWidgets import (
     QToolBar, QMessageBox, QWidget,
     QLabel, QFileDialog, QVBoxLayout,
     QApplication, QMainWindow, QHBoxLayout,
+    QProgressBar,
 )
 from PyQt5.QtGui import QColor, QPalette
 from PyQt5.QtGui import QDragEnterEvent, QDropEvent
 from PyQt5.QtCore import Qt, QSize, QPoint, QSettings
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
 
 
 from util import *
 from f90.f90 import *
 from ui.camera_win import CameraWindow
 from ui.imagebrowser import ImageBrowser
+from ui.thumbnail_loader import DECODE_MEMORY_LIMIT, decode_budget
+from ui.thumbnail_grid import PIXMAP_MEMORY_LIMIT
 from ui.roll_summary_table import RollSummaryTable, RollData
+from ui.roll_export import RollExporter
+from ui.frame_browser import FrameBrowser
+from ui.apply_roll_dialog import ApplyRollDialog
+from rollarchive import ARCHIVE_EXT, RollArchive, save_archive
+from frameexport import export_frames
 
 settings = QSettings('Oliver Hertel', 'EXIFilm')
 
@@ -32,54 +41,146 @@ settings = QSettings('Oliver Hertel', 'EXIFilm')
 
 
 
+class RollLoadSignals(QObject):
+    loaded=pyqtSignal(int,list)   # token, rolls
+    failed=pyqtSignal(int,str)    # token, error message
+
+
+
+class RollLoadTask(QRunnable):
+    def __init__(self, path: str, token: int, signals: RollLoadSignals):
+        super().__init__()
+        self.path, self.token, self.signals = path, token, signals
+
+    def run(self):
+        try:
+            if self.path.lower().endswith(ARCHIVE_EXT):
+                with RollArchive(self.path) as archive:
+                    rolls = list(archive)
+            elif self.path.lower().endswith('.csv'):
+                rolls = [RollData.from_csv(self.path)]
+            else:
+                rolls = [RollData.from_json(self.path)]
+        except Exception as e:
+            logger.error(f"Load error {self.path}: {e}")
+            self.signals.failed.emit(self.token, str(e))
+            return
+        logger.debug(f"Loaded {len(rolls)} roll(s) from {self.path}")
+        self.signals.loaded.emit(self.token, rolls)
+
+
+
 class DropTabWidget(QTabWidget):
     """A QTabWidget that accepts file drops."""
+    rolls_changed = pyqtSignal()
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setAcceptDrops(True)
         self.setTabsClosable(True)
         # tabs shall be moveable
         self.setMovable(True)
-        self.tabCloseRequested.connect(lambda i: self.removeTab(i))
+        self.tabCloseRequested.connect(self.close_tab)
+
+        # roll files are parsed in the background, their tabs
+        # are placeholders until the roll data arrived
+        self.pool = QThreadPool(self)
+        self.pending: Dict[int, RollSummaryTable] = {}
+        self.next_token = 0
+        self.signals = RollLoadSignals()
+        self.signals.loaded.connect(self.on_rolls_loaded)
+        self.signals.failed.connect(self.on_rolls_failed)
+
+        # optional tab with the frames of all rolls
+        self.frame_browser = None
+        self.rolls_changed.connect(self.update_frame_browser)
 
     def dragEnterEvent(self, event: QDragEnterEvent):
         # Only accept if it has file URLs
         if event.mimeData().hasUrls():
             for url in event.mimeData().urls():
-                if url.toLocalFile().lower().endswith(('.json', '.csv')):
+                if url.toLocalFile().lower().endswith(('.json', '.csv', ARCHIVE_EXT)):
                     event.acceptProposedAction()
                     return
         event.ignore()
 
     def dropEvent(self, event: QDropEvent):
         # For each file dropped, create a new tab
-        for url in event.mimeData().urls():
-            path = url.toLocalFile()
-            if path.lower().endswith('.json'):
-                self._load_json(path)
-            elif path.lower().endswith('.csv'):
-                self._load_csv(path)
+        paths = [url.toLocalFile() for url in event.mimeData().urls()]
+        self.load_files([p for p in paths if p.lower().endswith(('.json', '.csv', ARCHIVE_EXT))])
         event.acceptProposedAction()
 
-    def _load_json(self, path):
-        try:
-            roll = RollData.from_json(path)
-            roll_table = RollSummaryTable(roll)
-            self.addTab(roll_table, f"Roll {roll_table.roll.roll_number}")
-            logger.debug(f"Loaded roll {roll_table.roll.roll_number} from {path}")
-        except Exception as e:
-            logger.error(e)
-            self.addTab(QLabel(f"Error: {e}"), 'Error')
+    def load_files(self, paths: List[str]):
+        for path in paths:
+            placeholder = RollSummaryTable(None)
+            self.addTab(placeholder, os.path.basename(path))
+            self.pending[self.next_token] = placeholder
+            self.pool.start(RollLoadTask(path, self.next_token, self.signals))
+            self.next_token += 1
 
-    def _load_csv(self, path):
-        try:
-            roll = RollData.from_csv(path)
-            roll_table = RollSummaryTable(roll)
-            self.addTab(roll_table, f"Roll {roll_table.roll.roll_number}")
-            logger.debug(f"Loaded roll {roll_table.roll.roll_number} from {path}")
-        except Exception as e:
-            logger.error(e)
-            self.addTab(QLabel(f"Error: {e}"), 'Error')
+    def add_rolls(self, rolls: List[RollData]):
+        for roll in rolls:
+            self.addTab(RollSummaryTable(roll), f"Roll {roll.roll_number}")
+        self.rolls_changed.emit()
+
+    def rolls(self) -> List[RollData]:
+        """ All loaded rolls in tab order. """
+        rolls = []
+        for i in range(self.count()):
+            widget = self.widget(i)
+            if isinstance(widget, RollSummaryTable) and widget.roll:
+                rolls.append(widget.roll)
+        return rolls
+
+    def close_tab(self, index: int):
+        widget = self.widget(index)
+        self.removeTab(index)
+        if widget is None:
+            return
+        if widget is self.frame_browser:
+            self.frame_browser = None
+        # a roll still loading into this tab is dropped when it arrives
+        self.pending = {t: w for t, w in self.pending.items() if w is not widget}
+        widget.deleteLater()
+        if isinstance(widget, RollSummaryTable):
+            self.rolls_changed.emit()
+
+    def show_frame_browser(self):
+        if self.frame_browser is None:
+            self.frame_browser = FrameBrowser()
+            self.frame_browser.set_rolls(self.rolls())
+            self.insertTab(0, self.frame_browser, "All frames")
+        self.setCurrentWidget(self.frame_browser)
+
+    def update_frame_browser(self):
+        if self.frame_browser is not None:
+            self.frame_browser.set_rolls(self.rolls())
+
+    def on_rolls_loaded(self, token: int, rolls: list):
+        placeholder = self.pending.pop(token, None)
+        index = self.indexOf(placeholder) if placeholder else -1
+        if index == -1:
+            # tab has been closed while loading
+            return
+        if not rolls:
+            self.close_tab(index)
+            return
+
+        placeholder.set_roll(rolls[0])
+        self.setTabText(index, f"Roll {rolls[0].roll_number}")
+        # archives hold several rolls, which are inserted next to the first one
+        for i, roll in enumerate(rolls[1:], index + 1):
+            self.insertTab(i, RollSummaryTable(roll), f"Roll {roll.roll_number}")
+        self.rolls_changed.emit()
+
+    def on_rolls_failed(self, token: int, error: str):
+        placeholder = self.pending.pop(token, None)
+        index = self.indexOf(placeholder) if placeholder else -1
+        if index == -1:
+            return
+        self.removeTab(index)
+        placeholder.deleteLater()
+        self.insertTab(index, QLabel(f"Error: {error}"), 'Error')
 
 
 
@@ -141,6 +242,11 @@ class MainWindow(QMainWindow):
         self.act_save_roll.triggered.connect(self.save_current_roll)
         self.toolbar_rolls.addAction(self.act_save_roll)
 
+        self.roll_exporter = RollExporter(parent=self)
+        self.roll_exporter.finished.connect(self.on_export_finished)
+        self.export_progress = QProgressBar()
+        self.roll_exporter.progress.connect(self.export_progress.setValue)
+
         icon = load_svg_icon("svg/filetype-csv.svg", self.toolbar_rolls.iconSize(), self.icon_color)
         self.act_save_all_rolls_csv = QAction(icon, "Save CSV", self)
         self.act_save_all_rolls_csv.triggered.connect(lambda: self.save_all_rolls(extension='csv'))
@@ -151,8 +257,29 @@ class MainWindow(QMainWindow):
         self.act_save_all_rolls_json.triggered.connect(lambda: self.save_all_rolls(extension='json'))
         self.toolbar_rolls.addAction(self.act_save_all_rolls_json)
 
+        icon = load_svg_icon("svg/save-folder.svg", self.toolbar_rolls.iconSize(), self.icon_color)
+        self.act_save_archive = QAction(icon, "Archive", self)
+        self.act_save_archive.triggered.connect(self.save_archive)
+        self.toolbar_rolls.addAction(self.act_save_archive)
+
+        icon = load_svg_icon("svg/save-changed2.svg", self.toolbar_rolls.iconSize(), self.icon_color)
+        self.act_export_frames = QAction(icon, "Dataset", self)
+        self.act_export_frames.triggered.connect(self.export_frames)
+        self.toolbar_rolls.addAction(self.act_export_frames)
+
         self.toolbar_rolls.addSeparator()
 
+        icon = load_svg_icon("svg/folder-picture.svg", self.toolbar_rolls.iconSize(), self.icon_color)
+        self.act_frame_browser = QAction(icon, "All frames", self)
+        self.act_frame_browser.triggered.connect(self.roll_tabs.show_frame_browser)
+        self.toolbar_rolls.addAction(self.act_frame_browser)
+
+        icon = load_svg_icon("svg/plus-file2.svg", self.toolbar_rolls.iconSize(), self.icon_color)
+        self.act_apply_roll = QAction(icon, "Apply", self)
+        self.act_apply_roll.setToolTip("Apply the frames of a roll to the selected or all images")
+        self.act_apply_roll.triggered.connect(self.apply_roll_to_images)
+        self.toolbar_rolls.addAction(self.act_apply_roll)
+
         icon = load_svg_icon("svg/invisible.svg", self.toolbar_rolls.iconSize(), self.icon_color)
         self.act_auto_hide = QAction(icon, "Auto hide", self)
         self.act_auto_hide.triggered.connect(self.toggle_auto_hide)
@@ -192,10 +319,26 @@ class MainWindow(QMainWindow):
 
 
     def create_image_browser(self):
+        # memory all thumbnail decodes together may use, in MB
+        limit = settings.value('decode_memory_limit_mb', DECODE_MEMORY_LIMIT // 2**20, type=int)
+        decode_budget.set_limit(limit * 2**20)
         self.image_browser = ImageBrowser(self.statusBar(), icon_color=self.icon_color)
+        # memory held by thumbnail pixmaps, in MB
+        limit = settings.value('pixmap_memory_limit_mb', PIXMAP_MEMORY_LIMIT // 2**20, type=int)
+        self.image_browser.pixmaps.limit = limit * 2**20
+        # closing waits for running saves
+        self.close_after_save = False
+        self.image_browser.saves_finished.connect(self.on_saves_finished)
         return self.image_browser
 
 
+    def on_saves_finished(self):
+        if self.close_after_save:
+            self.close_after_save = False
+            # asks again if some images could not be saved
+            self.close()
+
+
     def show_camera_window(self):
         self.camera_window = CameraWindow()
         self.camera_window.show()
@@ -206,35 +349,32 @@ class MainWindow(QMainWindow):
     @pyqtSlot(list)
     def on_roll_data(self, rolls: list[RollData]):
         logger.debug(f"Received {len(rolls)} rolls from camera")
-        
-        for roll in rolls:
-            try:
-                roll_table = RollSummaryTable(roll)
-                self.roll_tabs.addTab(roll_table, f"Roll {roll.roll_number}")
-            except Exception as e:
-                logger.error(e)
-                self.roll_tabs.addTab(QLabel(f"Error: {e}"), 'Error')
+        self.roll_tabs.add_rolls(rolls)
 
 
     def load_roll(self):
-        files, _ = QFileDialog.getOpenFileNames(self, 'Select Roll', '', 'Rolls (*.json)')
-        if not files:
+        files, _ = QFileDialog.getOpenFileNames(self, 'Select Roll', '', f'Rolls (*.json *{ARCHIVE_EXT})')
+        if files:
+            self.roll_tabs.load_files(files)
+
+
+    def apply_roll_to_images(self):
+        rolls = self.roll_tabs.rolls()
+        images = self.image_browser.target_images()
+        if not rolls or not images:
             return
-        
-        for file in files:
-            try:
-                roll = RollData.from_json(file)
-                roll_table = RollSummaryTable(roll)
-                self.roll_tabs.addTab(roll_table, f"Roll {roll_table.roll.roll_number}")
-                logger.debug(f"Loaded roll {roll_table.roll.roll_number} from {file}")
-            except Exception as e:
-                logger.error(e)
-                self.roll_tabs.addTab(QLabel(f"Error: {e}"), 'Error')
+
+        current = self.roll_tabs.currentWidget()
+        current = current.roll if isinstance(current, RollSummaryTable) else None
+        dlg = ApplyRollDialog(rolls, [img.path for img in images], current, self)
+        if not dlg.exec_():
+            return
+        self.image_browser.apply_exif_updates([(images[i], exif) for i, exif in dlg.assignments()])
 
 
     def save_current_roll(self):
         current = self.roll_tabs.currentWidget()
-        if not current or not isinstance(current, RollSummaryTable):
+        if not isinstance(current, RollSummaryTable) or not current.roll:
             return
 
         try:
@@ -243,34 +383,94 @@ class MainWindow(QMainWindow):
             if not path:
                 return
             if path.lower().endswith('.csv'):
-                current.save_csv(path)
+                current.roll.save_csv(path)
             else:
-                current.save_json(path)
+                current.roll.save_json(path)
         except Exception as e:
             logger.error(e)
-            ErrorMsgBox("Error saving roll", str(e), self).exec_()
+            ErrorMsgBox("Error saving roll", str(e)).exec_()
 
 
     def save_all_rolls(self, path=None, extension='json'):
+        if self.roll_exporter.is_running():
+            return
+
         # ask for folder name
         path = QFileDialog.getExistingDirectory(
             self, f'Save all rolls as {extension}', '', QFileDialog.ShowDirsOnly)
         if not path:
             return
 
-        for i in range(self.roll_tabs.count()):
-            current = self.roll_tabs.widget(i)
-            if not current or not isinstance(current, RollSummaryTable):
-                continue
+        rolls = self.roll_tabs.rolls()
+        if not rolls:
+            return
+
+        self.act_save_all_rolls_csv.setEnabled(False)
+        self.act_save_all_rolls_json.setEnabled(False)
+        self.export_progress.setValue(0)
+        self.statusBar().addPermanentWidget(self.export_progress)
+        self.export_progress.show()
+        self.roll_exporter.export(rolls, path, extension)
+
+
+    def on_export_finished(self, errors: list):
+        self.statusBar().removeWidget(self.export_progress)
+        self.act_save_all_rolls_csv.setEnabled(True)
+        self.act_save_all_rolls_json.setEnabled(True)
+        if errors:
+            report = '\n'.join(f"{os.path.basename(path)}: {error}" for path, error in errors)
+            ErrorMsgBox("Error saving rolls", f"{len(errors)} roll(s) could not be saved:\n\n{report}").exec_()
+
+
+    def save_archive(self):
+        rolls = self.roll_tabs.rolls()
+        if not rolls:
+            return
+
+        path, _ = QFileDialog.getSaveFileName(self, 'Save roll archive', '', f'Roll archive (*{ARCHIVE_EXT})')
+        if not path:
+            return
+        if not path.lower().endswith(ARCHIVE_EXT):
+            path += ARCHIVE_EXT
+
+        try:
+            save_archive(path, rolls)
+        except Exception as e:
+            logger.error(e)
+            ErrorMsgBox("Error saving roll archive", str(e)).exec_()
+
+
+    def export_frames(self):
+        rolls = self.roll_tabs.rolls()
+        if not rolls:
+            return
+
+        path, _ = QFileDialog.getSaveFileName(
+            self, 'Export frames', '', 'JSON Lines (*.jsonl);;CSV (*.csv)',
+            options=QFileDialog.DontConfirmOverwrite)
+        if not path:
+            return
+
+        # existing exports can be extended instead of rewritten
+        append = False
+        if os.path.exists(path):
+            msg = QMessageBox(self)
+            msg.setIcon(QMessageBox.Question)
+            msg.setText(f"{os.path.basename(path)} already exists.")
+            msg.setInformativeText("Append the rolls to the existing export?")
+            btn_append = msg.addButton("Append", QMessageBox.AcceptRole)
+            msg.addButton("Replace", QMessageBox.DestructiveRole)
+            msg.addButton(QMessageBox.Cancel)
+            msg.exec_()
+            if msg.clickedButton() == msg.button(QMessageBox.Cancel):
+                return
+            append = msg.clickedButton() == btn_append
 
-            try:
-                if extension == 'csv':
-                    current.save_csv(os.path.join(path, f"roll_{current.roll}.csv"))
-                else:
-                    current.save_json(os.path.join(path, f"roll_{current.roll}.json"))
-            except Exception as e:
-                logger.error(e)
-                ErrorMsgBox("Error saving roll", str(e), self).exec_()
+        try:
+            export_frames(path, rolls, append)
+        except Exception as e:
+            logger.error(e)
+            ErrorMsgBox("Error exporting frames", str(e)).exec_()
 
 
     def store_window_state(self):
@@ -310,6 +510,12 @@ class MainWindow(QMainWindow):
     def closeEvent(self, event):
         self.store_window_state()
 
+        if self.image_browser.is_saving():
+            # close once the images are written
+            self.close_after_save = True
+            event.ignore()
+            return
+
         # check for unsaved changes
         unsaved = [img for img in self.image_browser.exif_images if img.has_changes()]
         if unsaved:
@@ -324,12 +530,14 @@ class MainWindow(QMainWindow):
                 event.ignore()
                 return
             elif ret == QMessageBox.Yes:
+                # saved in the background, the window closes when they are done
                 self.image_browser.save_all_changed_images()
-                event.accept()
-                return
-            else:
-                event.accept()
+                self.close_after_save = True
+                event.ignore()
                 return
+
+        # child widgets get no close event, the loaders are stopped here
+        self.image_browser.shutdown()
         event.accept()
 
 
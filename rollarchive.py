@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+#
+
+import os
+import mmap
+import math
+import struct
+from typing import Any, Dict, Iterator, List
+
+from util import *
+from rolldata import *
+from f90.constants import *
+
+
+# Binary roll archive layout (all integers little endian):
+#
+#   header   magic "EXFA", version (u16), reserved (u16), roll count (u32)
+#   index    one fixed size entry per roll, see INDEX_ENTRY
+#   data     per roll: raw frame bytes, model (utf-8), description (utf-8)
+#
+# The index entries have a fixed size, so entry i lives at
+# HEADER.size + i * INDEX_ENTRY.size and a single roll can be read
+# without touching any other roll.
+
+ARCHIVE_EXT     = '.exfa'
+ARCHIVE_MAGIC   = b'EXFA'
+ARCHIVE_VERSION = 1
+
+HEADER      = struct.Struct('<4sHHI')
+# roll number, data offset, raw length, frame count, frame size, iso code, model length, description length
+INDEX_ENTRY = struct.Struct('<IQIIBBHI')
+
+# ISO code stored for rolls without a known ISO
+ISO_NONE = 0xFF
+
+
+
+def _reverse(table: Dict[int, Any]) -> Dict[Any, int]:
+    """ Map decoded values back to the first code producing them. """
+    rev = {}
+    for code, value in table.items():
+        if isinstance(value, float) and math.isnan(value):
+            continue
+        rev.setdefault(value, code)
+    return rev
+
+
+def _first_nan(table: Dict[int, Any]) -> int:
+    return next(k for k, v in table.items() if isinstance(v, float) and math.isnan(v))
+
+
+_SHUTTER_CODES  = _reverse(SHUTTER_SPEEDS)
+_APERTURE_CODES = _reverse(APERTURES)
+_FOCAL_CODES    = _reverse(FOCAL_LENGTHS)
+_EXPOSURE_CODES = _reverse(EXPOSURE_MODES)
+_METERING_CODES = _reverse(METERING_SYSTEM)
+_FLASH_CODES    = _reverse(FLASH_MODES)
+_ISO_CODES      = _reverse(ISO_VALUES)
+
+
+def _encode(value: Any, codes: Dict[Any, int], table: Dict[int, Any]) -> int:
+    """ Encode a decoded field value back to its camera byte code. """
+    if isinstance(value, str) and value.startswith('Unknown(0x'):
+        return int(value[10:-1], 16)
+    if isinstance(value, float) and math.isnan(value):
+        return _first_nan(table)
+    if value in codes:
+        return codes[value]
+    raise ValueError(f"Cannot encode value '{value}'")
+
+
+def encode_iso(iso: Any) -> int:
+    if iso is None:
+        return ISO_NONE
+    return _encode(iso, _ISO_CODES, ISO_VALUES)
+
+
+def encode_frames(roll: RollData) -> bytes:
+    """
+    Encode the decoded frames of a roll back into the camera's raw frame bytes.
+    Rolls decoded from camera data keep their raw bytes, which are used as is.
+    """
+    if roll.raw:
+        return bytes(roll.raw)
+
+    frame_size = roll.frame_size or guess_frame_size(roll.frames)
+    raw = bytearray()
+    for frame in roll.frames:
+        chunk = bytearray(frame_size)
+        chunk[0] = _encode(frame[ExifTagNames.Shutter], _SHUTTER_CODES, SHUTTER_SPEEDS)
+        chunk[1] = _encode(frame[ExifTagNames.Aperture], _APERTURE_CODES, APERTURES)
+        if frame_size >= 4:
+            chunk[2] = (
+                _encode(frame[ExifTagNames.ExposureMode], _EXPOSURE_CODES, EXPOSURE_MODES) |
+                _encode(frame[ExifTagNames.MeteringMode], _METERING_CODES, METERING_SYSTEM) << 4 |
+                _encode(frame[ExifTagNames.Flash], _FLASH_CODES, FLASH_MODES) << 6
+            )
+            chunk[3] = _encode(frame[ExifTagNames.FocalLength], _FOCAL_CODES, FOCAL_LENGTHS)
+        raw.extend(chunk)
+    return bytes(raw)
+
+
+def guess_frame_size(frames: List[Dict[Any, Any]]) -> int:
+    if frames and ExifTagNames.FocalLength in frames[0]:
+        return 4
+    return 2
+
+
+def decode_frames(raw: bytes, frame_size: int, iso: Any, model: str) -> List[Dict[Any, Any]]:
+    """ Decode raw frame bytes the same way decode_roll_data does for camera data. """
+    frames = []
+    for i in range(0, len(raw), frame_size):
+        frame = raw[i:i+frame_size]
+        if len(frame) < 2:
+            break
+        frames.append({
+            ExifTagNames.ImageNumber: len(frames) + 1,
+            ExifTagNames.Shutter:     parse_shutter(frame[0]),
+            ExifTagNames.Aperture:    parse_aperture(frame[1]),
+            ExifTagNames.ISO:         iso,
+            ExifTagNames.Make:        "Nikon",
+            ExifTagNames.Model:       model,
+        })
+        if frame_size >= 4 and len(frame) >= 4:
+            frames[-1].update({
+                ExifTagNames.FocalLength:  parse_focal_length(frame[3]),
+                ExifTagNames.ExposureMode: parse_exposure_mode(frame[2] & 0b00001111),
+                ExifTagNames.MeteringMode: parse_metering_mode((frame[2] & 0b00110000) >> 4),
+                ExifTagNames.Flash:        parse_flash_mode((frame[2] & 0b11000000) >> 6)
+            })
+    return frames
+
+
+
+class ArchiveEntry:
+    """ One index entry of a roll archive. """
+    def __init__(self, roll_number: int, offset: int, raw_len: int, frame_count: int,
+                 frame_size: int, iso_code: int, model_len: int, desc_len: int):
+        self.roll_number = roll_number
+        self.offset      = offset
+        self.raw_len     = raw_len
+        self.frame_count = frame_count
+        self.frame_size  = frame_size
+        self.iso_code    = iso_code
+        self.model_len   = model_len
+        self.desc_len    = desc_len
+
+    @property
+    def iso(self) -> Any:
+        return None if self.iso_code == ISO_NONE else parse_iso(self.iso_code)
+
+    def __str__(self):
+        return f"Roll {self.roll_number} ({self.iso}) - {self.frame_count} frames"
+
+
+
+class RollArchive:
+    """
+    Read-only view on a binary roll archive.
+
+    The file is memory mapped, so opening an archive only parses the header.
+    Raw frame bytes are handed out as memoryview slices of the mapping and
+    single rolls are decoded on demand.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            self._file.close()
+            raise ValueError(f"{path} is not a roll archive")
+        self._view = memoryview(self._mm)
+
+        magic, version, _, count = HEADER.unpack_from(self._mm, 0)
+        if magic != ARCHIVE_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a roll archive")
+        if version > ARCHIVE_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported roll archive version {version}")
+        self._count = count
+
+
+    def __len__(self):
+        return self._count
+
+
+    def __iter__(self) -> Iterator[RollData]:
+        for i in range(self._count):
+            yield self.load(i)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def close(self):
+        if self._mm is None:
+            return
+        self._view.release()
+        self._mm.close()
+        self._file.close()
+        self._mm = None
+
+
+    def entry(self, index: int) -> ArchiveEntry:
+        if not 0 <= index < self._count:
+            raise IndexError(f"Roll index {index} out of range")
+        return ArchiveEntry(*INDEX_ENTRY.unpack_from(self._mm, HEADER.size + index * INDEX_ENTRY.size))
+
+
+    def entries(self) -> List[ArchiveEntry]:
+        return [self.entry(i) for i in range(self._count)]
+
+
+    def raw(self, index: int) -> memoryview:
+        """ Raw frame bytes of a roll, without copying. """
+        e = self.entry(index)
+        return self._view[e.offset:e.offset + e.raw_len]
+
+
+    def load(self, index: int) -> RollData:
+        e = self.entry(index)
+        pos = e.offset + e.raw_len
+        model = bytes(self._view[pos:pos + e.model_len]).decode('utf-8')
+        pos += e.model_len
+        desc = bytes(self._view[pos:pos + e.desc_len]).decode('utf-8')
+
+        raw = bytes(self.raw(index))
+        iso = e.iso
+        frames = decode_frames(raw, e.frame_size, iso, model)
+        return RollData(e.roll_number, iso, frames, desc, frame_size=e.frame_size, raw=raw)
+
+
+
+def save_archive(filename: str, rolls: List[RollData]):
+    """ Write all rolls into one binary roll archive. """
+    blobs = []
+    for roll in rolls:
+        raw = encode_frames(roll)
+        model = str(roll.frames[0].get(ExifTagNames.Model, "")) if roll.frames else ""
+        blobs.append((roll, raw, model.encode('utf-8'), (roll.desc or "").encode('utf-8')))
+
+    offset = HEADER.size + len(blobs) * INDEX_ENTRY.size
+    with atomic_write(filename, 'wb') as f:
+        f.write(HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, 0, len(blobs)))
+        for roll, raw, model, desc in blobs:
+            f.write(INDEX_ENTRY.pack(
+                int(roll.roll_number),
+                offset,
+                len(raw),
+                len(roll.frames),
+                roll.frame_size or guess_frame_size(roll.frames),
+                encode_iso(roll.iso),
+                len(model),
+                len(desc),
+            ))
+            offset += len(raw) + len(model) + len(desc)
+        for _, raw, model, desc in blobs:
+            f.write(raw)
+            f.write(model)
+            f.write(desc)
+    logger.debug(f"Saved {len(blobs)} rolls to {filename}")
+
+
+def load_archive(filename: str) -> List[RollData]:
+    with RollArchive(filename) as archive:
+        return list(archive)
+
+
+def archive_to_json(filename: str, folder: str) -> List[str]:
+    """ Export every roll of an archive as one JSON file per roll. """
+    paths, used = [], set()
+    with RollArchive(filename) as archive:
+        for roll in archive:
+            path = os.path.join(folder, roll_filename(roll, 'json', used))
+            roll.save_json(path)
+            paths.append(path)
+    return paths
+
+
+def json_to_archive(filenames: List[str], filename: str):
+    save_archive(filename, [RollData.from_json(path) for path in filenames])
@@ -80,12 +80,41 @@ def decode_binary_roll_data(frames:List, iso:int, roll:int):
 
 
 
+def frame_exif(roll: 'RollData', frame: Dict[Any, Any]) -> Dict[int, Any]:
+    """ EXIF update for one frame, keyed by EXIF tag IDs. """
+    exif_data = {}
+    for k, v in frame.items():
+        exif_data[k.value] = v
+    exif_data[ExifTagNames.ISO.value] = roll.iso
+    return exif_data
+
+
+def roll_filename(roll: 'RollData', extension: str, used: set) -> str:
+    """
+    File name of a roll exported with others. Rolls of different cameras can
+    share a number, later ones get a suffix so they do not replace each other.
+    `used` collects the names handed out so far.
+    """
+    name = f"roll_{roll.roll_number}.{extension}"
+    n = 2
+    while name.lower() in used:
+        name = f"roll_{roll.roll_number}_{n}.{extension}"
+        n += 1
+    used.add(name.lower())
+    return name
+
+
+
 class RollData:
-    def __init__(self, roll_number: int, iso: int, frames: List=[], desc: str=""):
+    def __init__(self, roll_number: int, iso: int, frames: List=[], desc: str="",
+                 frame_size: int=0, raw: bytes=b""):
         self.roll_number = roll_number
         self.iso         = iso
         self.desc        = desc
         self.frames      = frames
+        # raw frame bytes as stored by the camera, if known
+        self.frame_size  = frame_size
+        self.raw         = raw
 
 
     def __str__(self):
@@ -93,33 +122,37 @@ class RollData:
 
 
     def save_csv(self, filename: str):
-        with open(filename, 'w') as f:
-            # print heeader: roll number, iso
-            f.write(f"# Roll Number,{self.roll_number}\n")
-            f.write(f"# ISO,{self.iso}\n")
-            f.write(f"# Frames,{len(self.frames)}\n")
-            f.write(f"# Description,{len(self.desc)}\n")
-
-            f.write(f"{', '.join([col.string for col in COLUMNS])}\n")
-            for i, frame in enumerate(self.frames):
-                for col in COLUMNS:
-                    if col in frame:
-                        # format aperture and shutter
-                        if col == ExifTagNames.Shutter:
-                            f.write(f"{format_exposure_time(frame[col])},")
-                        elif col == ExifTagNames.Aperture:
-                            f.write(f"{format_aperture(frame[col])},")
-                        elif col == ExifTagNames.FocalLength:
-                            f.write(f"{frame[col]} mm,")
-                        else:
-                            f.write(f"{frame[col]},")
-                    else:
-                        continue
-                        # f.write("Unknown,")
-                f.write("\n")
+        with atomic_write(filename, 'w', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            # print header: roll number, iso
+            writer.writerow(["# Roll Number", self.roll_number])
+            writer.writerow(["# ISO", self.iso])
+            writer.writerow(["# Frames", len(self.frames)])
+            writer.writerow(["# Description", self.desc])
+
+            writer.writerow([col.string for col in COLUMNS])
+            writer.writerows(self.csv_rows())
         logger.debug(f"Saved {len(self.frames)} frames to {filename}")
 
 
+    def csv_rows(self):
+        for frame in self.frames:
+            row = []
+            for col in COLUMNS:
+                if col not in frame:
+                    continue
+                # format aperture and shutter
+                if col == ExifTagNames.Shutter:
+                    row.append(format_exposure_time(frame[col]))
+                elif col == ExifTagNames.Aperture:
+                    row.append(format_aperture(frame[col]))
+                elif col == ExifTagNames.FocalLength:
+                    row.append(f"{frame[col]} mm")
+                else:
+                    row.append(frame[col])
+            yield row
+
+
     def save_json(self, filename: str):
         # convert value exiftagenames (keys of frames) to hex numbers
         frames = []
@@ -139,7 +172,7 @@ class RollData:
         }
         
         # save the roll data
-        with open(filename, 'w') as f:
+        with atomic_write(filename, 'w') as f:
             json.dump(data, f, indent=4)
         logger.debug(f"Saved {len(self.frames)} frames to {filename}")
 
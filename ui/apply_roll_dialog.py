@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+
+from typing import List
+
+from PyQt5.QtWidgets import (
+    QDialog, QFormLayout, QComboBox, QSpinBox,
+    QLineEdit, QLabel, QDialogButtonBox
+)
+
+from util import *
+from rolldata import *
+from frameassign import *
+
+
+
+class ApplyRollDialog(QDialog):
+    """
+    Asks how the frames of a roll are mapped onto images and shows
+    how many images would be tagged.
+    """
+    def __init__(self, rolls: List[RollData], paths: List[str], current: RollData=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Apply roll to images")
+        self.rolls = rolls
+        self.paths = paths
+
+        layout = QFormLayout(self)
+
+        self.cmb_roll = QComboBox()
+        for roll in rolls:
+            self.cmb_roll.addItem(str(roll))
+        if current in rolls:
+            self.cmb_roll.setCurrentIndex(rolls.index(current))
+        layout.addRow("Roll:", self.cmb_roll)
+
+        self.cmb_mode = QComboBox()
+        self.cmb_mode.addItem("Image order", ASSIGN_BY_ORDER)
+        self.cmb_mode.addItem("Frame number in file name", ASSIGN_BY_FILENAME)
+        layout.addRow("Match by:", self.cmb_mode)
+
+        self.spn_offset = QSpinBox()
+        self.spn_offset.setRange(-99, 99)
+        self.spn_offset.setToolTip("Shift the frames assigned to the images")
+        layout.addRow("Frame offset:", self.spn_offset)
+
+        self.txt_skip = QLineEdit()
+        self.txt_skip.setPlaceholderText("e.g. 1, 5-7")
+        self.txt_skip.setToolTip("Frames without an image, e.g. blank or lost exposures")
+        layout.addRow("Skip frames:", self.txt_skip)
+
+        self.lbl_preview = QLabel("")
+        layout.addRow(self.lbl_preview)
+
+        self.buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        self.buttons.accepted.connect(self.accept)
+        self.buttons.rejected.connect(self.reject)
+        layout.addRow(self.buttons)
+
+        self.cmb_roll.currentIndexChanged.connect(self.update_preview)
+        self.cmb_mode.currentIndexChanged.connect(self.update_preview)
+        self.spn_offset.valueChanged.connect(self.update_preview)
+        self.txt_skip.textChanged.connect(self.update_preview)
+        self.update_preview()
+
+
+    def assignments(self):
+        """ (image index, EXIF update) pairs for the current settings. """
+        roll = self.rolls[self.cmb_roll.currentIndex()]
+        skip = parse_frame_list(self.txt_skip.text())
+        return assign_frames(roll, self.paths, self.cmb_mode.currentData(), self.spn_offset.value(), skip)
+
+
+    def update_preview(self):
+        ok = self.buttons.button(QDialogButtonBox.Ok)
+        try:
+            count = len(self.assignments())
+        except ValueError:
+            self.lbl_preview.setText("<font color='#ea2055'>Invalid frame list</font>")
+            ok.setEnabled(False)
+            return
+        self.lbl_preview.setText(f"{count} of {len(self.paths)} images will be tagged")
+        ok.setEnabled(count > 0)
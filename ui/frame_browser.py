@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+#
+
+from typing import List
+
+from PyQt5.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QTableView,
+    QLabel, QAbstractItemView, QLineEdit
+)
+from PyQt5.QtGui import QDrag
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer
+
+from util import *
+from rolldata import *
+from frameindex import *
+from ui.roll_summary_table import frame_mime_data
+
+
+
+class FrameBrowserModel(QAbstractTableModel):
+    """
+    Virtual table over a FrameIndex. Only the visible row ids are kept,
+    filtering and sorting replace that list in one go.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.index_data = FrameIndex([])
+        self.rows: List[int] = []
+        self.filters: List[FrameFilter] = []
+        self.sort_column = -1
+        self.sort_order  = Qt.AscendingOrder
+
+    def set_rolls(self, rolls: List[RollData]):
+        self.beginResetModel()
+        self.index_data = FrameIndex(rolls)
+        self._update_rows()
+        self.endResetModel()
+
+    def set_filters(self, filters: List[FrameFilter]):
+        self.beginResetModel()
+        self.filters = filters
+        self._update_rows()
+        self.endResetModel()
+
+    def _update_rows(self):
+        rows = self.index_data.filter(self.filters)
+        if self.sort_column >= 0:
+            rows = self.index_data.sort(rows, self.sort_column, self.sort_order == Qt.DescendingOrder)
+        self.rows = rows
+
+    def frame(self, row: int):
+        return self.index_data.frame(self.rows[row])
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(INDEX_COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return INDEX_COLUMNS[section][0]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return self.index_data.display(self.rows[index.row()], index.column())
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column
+        self.sort_order  = order
+        if column < 0:
+            return
+        self.layoutAboutToBeChanged.emit()
+        self.rows = self.index_data.sort(self.rows, column, order == Qt.DescendingOrder)
+        self.layoutChanged.emit()
+
+
+
+class FrameBrowser(QWidget):
+    """
+    One table with the frames of all loaded rolls.
+
+    The filter accepts expressions like "ISO 400 and focal length >= 85"
+    and is applied while typing.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rolls: List[RollData] = []
+        self.is_dirty = False
+        # coalesce roll updates, e.g. while many files are loading
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(50)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+        layout = QVBoxLayout(self)
+
+        filter_layout = QHBoxLayout()
+        layout.addLayout(filter_layout)
+        self.txt_filter = QLineEdit(self)
+        self.txt_filter.setPlaceholderText('Filter, e.g. "ISO 400 and focal length >= 85"')
+        self.txt_filter.setClearButtonEnabled(True)
+        self.txt_filter.textChanged.connect(self.on_filter_changed)
+        filter_layout.addWidget(self.txt_filter)
+        self.lbl_status = QLabel("")
+        filter_layout.addWidget(self.lbl_status)
+
+        self.model = FrameBrowserModel(self)
+        self.table = QTableView(self)
+        self.table.setModel(self.model)
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table.setSortingEnabled(True)
+        self.table.horizontalHeader().setResizeContentsPrecision(50)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setDragEnabled(True)
+        self.table.setDragDropMode(QAbstractItemView.DragOnly)
+        self.table.startDrag = self.start_drag
+        layout.addWidget(self.table)
+
+
+    def set_rolls(self, rolls: List[RollData]):
+        self.rolls = rolls
+        # the index is only rebuilt while the browser is visible
+        self.is_dirty = True
+        if self.isVisible():
+            self.refresh_timer.start()
+
+
+    def showEvent(self, event):
+        if self.is_dirty:
+            self.refresh()
+        super().showEvent(event)
+
+
+    def refresh(self):
+        self.refresh_timer.stop()
+        self.is_dirty = False
+        self.model.set_rolls(self.rolls)
+        self.table.resizeColumnsToContents()
+        self.update_status([])
+
+
+    def on_filter_changed(self, text: str):
+        filters, errors = parse_filter(text)
+        self.model.set_filters(filters)
+        self.update_status(errors)
+
+
+    def update_status(self, errors: List[str]):
+        if errors:
+            self.lbl_status.setText(f"<font color='#ea2055'>{errors[0]}</font>")
+        else:
+            self.lbl_status.setText(f"{self.model.rowCount()} of {len(self.model.index_data)} frames")
+
+
+    def start_drag(self, supported_actions):
+        selected = self.table.selectionModel().selectedRows()
+        if not selected:
+            return
+        roll, frame = self.model.frame(selected[0].row())
+        drag = QDrag(self)
+        drag.setMimeData(frame_mime_data(roll, frame))
+        drag.exec_(Qt.CopyAction)
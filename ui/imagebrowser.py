@@ -1,29 +1,31 @@
 import os
+import time
+import heapq
 import pickle
+import threading
 from PIL import Image, ExifTags
-from typing import Any, Dict, List, Set, Tuple
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout,
     QTableWidget, QTableWidgetItem, QFileDialog,
-    QScrollArea, QFrame, QProgressBar,
+    QListView, QFrame, QProgressBar,
     QSplitter, QAction, QHeaderView,
-    QToolBar
+    QToolBar, QAbstractItemView
 )
-from PyQt5.QtGui import QPixmap, QImage, QColor
-from PyQt5.QtCore import Qt, QSize, QRunnable, QThreadPool, pyqtSignal, QObject
+from PyQt5.QtGui import QPixmap, QImage, QColor, QDrag
+from PyQt5.QtCore import Qt, QSize, QMimeData, QRunnable, QThreadPool, QTimer, pyqtSignal, QObject
 
 
 from util import *
 from f90.f90 import *
-from ui.flow_layout import FlowLayout
-from ui.thumbnail_widget import ThumbnailWidget, ExifImage
+from ui.thumbnail_widget import ExifImage
+from ui.thumbnail_grid import ImageCollection, ThumbnailModel, ThumbnailDelegate, PixmapBudget, grid_slot, visible_rows
+from ui.thumbnail_loader import IMAGE_EXTS, ImageRecord, read_image, read_image_info, scan_images
+from ui.thumbnail_cache import ThumbnailCache
 
 
 
-IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.tiff', '.gif')
-
-
 class InsertionIndicator(QFrame):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -36,46 +38,258 @@ class InsertionIndicator(QFrame):
 
 
 
+# images per metadata_ready signal
+METADATA_BATCH = 100
+# a partial batch is sent once it is this old, so slow scans still show progress (s)
+METADATA_LATENCY = 0.1
+# results arriving within one frame are inserted together (ms)
+INSERT_INTERVAL = 16
+# thumbnails are reordered once scrolling paused for this long (ms)
+REPRIORITIZE_INTERVAL = 50
+# files written at the same time, saving is bound by the disk rather than the CPU
+SAVE_THREADS = 4
+
+
+
+# all signals carry the generation of the loading session as first argument
 class WorkerSignals(QObject):
-    progress=pyqtSignal(int)
-    thumbnail_ready=pyqtSignal(str,QPixmap,dict)
+    thumbnail_done=pyqtSignal(int,str)
+    metadata_ready=pyqtSignal(int,list)
+    scan_done=pyqtSignal(int)
+    thumbnail_ready=pyqtSignal(int,object)
+
+
+
+class SaveSignals(QObject):
+    saved=pyqtSignal(object,object,object,str)    # image, written tags, skipped tags, error message or ''
+
+
+
+class SaveTask(QRunnable):
+    """
+    Writes the EXIF tags of one image. The tags are a copy taken when the
+    save was queued, the browser applies the result in the GUI thread.
+    """
+    def __init__(self,img:ExifImage,exif:Dict[int,Any],signals:SaveSignals):
+        super().__init__(); self.img,self.exif,self.signals=img,exif,signals
+
+    def run(self):
+        skipped, error = {}, ''
+        try:
+            skipped = self.img.write_exif(self.exif)
+        except Exception as e:
+            logger.error(f"Failed saving EXIF for {self.img.path}: {e}")
+            error = str(e) or type(e).__name__
+        self.signals.saved.emit(self.img, self.exif, skipped, error)
+
+
+
+class ThumbnailQueue:
+    """
+    Thread safe priority queue of the images still waiting for their
+    thumbnail, lowest priority value first. Images of equal priority keep
+    the order they were added in.
+
+    The queue also counts the workers draining it, so the browser starts
+    no more workers than there are images or threads.
+    """
+    def __init__(self, max_workers: int):
+        self.lock = threading.Lock()
+        self.heap: List[Tuple[int, int, str]] = []
+        self.seq = 0
+        self.workers = 0
+        self.max_workers = max_workers
+
+    def push(self, items: List[Tuple[int, str]]) -> int:
+        """ Queue (priority, path) pairs, returns the number of workers to start. """
+        with self.lock:
+            for priority, path in items:
+                self.heap.append((priority, self.seq, path))
+                self.seq += 1
+            heapq.heapify(self.heap)
+            start = max(min(len(self.heap), self.max_workers) - self.workers, 0)
+            self.workers += start
+            return start
+
+    def pop(self) -> Optional[str]:
+        """ Most urgent path, None if the queue is empty and the worker should stop. """
+        with self.lock:
+            if not self.heap:
+                self.workers -= 1
+                return None
+            return heapq.heappop(self.heap)[2]
+
+    def reprioritize(self, priority: Callable[[str], int]):
+        with self.lock:
+            self.heap = [(priority(path), seq, path) for _, seq, path in self.heap]
+            heapq.heapify(self.heap)
+
+    def clear(self):
+        with self.lock:
+            self.heap.clear()
+
+    def __len__(self):
+        return len(self.heap)
+
+
+
+class LoadSession:
+    """
+    One call of start_loading. Its tasks stop as soon as the session is
+    cancelled, and results of an older generation are dropped by the browser.
+    """
+    def __init__(self, generation: int, max_workers: int=1):
+        self.generation = generation
+        self.cancelled = threading.Event()
+        self.queue = ThumbnailQueue(max_workers)
+
+    def cancel(self):
+        self.cancelled.set()
+        self.queue.clear()
+
+    def is_cancelled(self) -> bool:
+        return self.cancelled.is_set()
+
+
+
+class MetadataTask(QRunnable):
+    """
+    Scans files and folders for images and reads their EXIF tags, without
+    decoding any pixels, so the images can be listed and sorted before the
+    thumbnails are ready. Tags of unchanged files come from the cache.
+    Images are sent in batches while the scan goes on.
+    """
+    def __init__(self,paths:List[str],recursive:bool,session:LoadSession,signals:WorkerSignals,cache:ThumbnailCache=None):
+        super().__init__(); self.paths,self.recursive,self.session,self.signals=paths,recursive,session,signals
+        self.cache=cache
+
+    def run(self):
+        gen = self.session.generation
+        batch, started = [], time.monotonic()
+        for path, st in scan_images(self.paths, self.recursive):
+            if self.session.is_cancelled():
+                return
+            try:
+                exif = self.cache.get_exif(path, st) if self.cache else None
+                if exif is None:
+                    batch.append(read_image_info(path, st))
+                else:
+                    batch.append(ImageRecord(path, st, exif, QImage()))
+            except Exception as e:
+                logger.error(f"Load error {path}: {e}")
+            if len(batch) >= METADATA_BATCH or (batch and time.monotonic() - started > METADATA_LATENCY):
+                self.signals.metadata_ready.emit(gen, batch)
+                batch, started = [], time.monotonic()
+        if batch:
+            self.signals.metadata_ready.emit(gen, batch)
+        self.signals.scan_done.emit(gen)
 
 
 
 class LoadTask(QRunnable):
-    def __init__(self,path:str,thumb_size:QSize,idx:int,total:int,signals:WorkerSignals):
-        super().__init__(); self.path,self.thumb_size,self.idx,self.total,self.signals=path,thumb_size,idx,total,signals
+    """
+    Builds thumbnails from the cache or from a single open of each file,
+    taking the most urgent image from the session queue until it is empty
+    or the session is cancelled. A task can outlive many images, its owner
+    cancels the session and waits for the pool before it goes away.
+    """
+    def __init__(self,thumb_size:QSize,session:LoadSession,signals:WorkerSignals,cache:ThumbnailCache=None):
+        super().__init__(); self.thumb_size,self.session,self.signals=thumb_size,session,signals
+        self.cache=cache
     
     def run(self):
-        pix = QPixmap()
-        exif_data = {}
+        while not self.session.is_cancelled():
+            path = self.session.queue.pop()
+            if path is None:
+                return
+            self.load(path)
+
+    def load(self, path: str):
+        gen = self.session.generation
         try:
-            img = Image.open(self.path)
-            raw = img._getexif() or {}
-            exif_data = {t:v for t,v in raw.items()}
-            # exif_data={ExifTags.TAGS.get(t,t):v for t,v in raw.items()}
-            qimg=QImage(self.path).scaled(self.thumb_size,Qt.KeepAspectRatio,Qt.SmoothTransformation)
-            pix=QPixmap.fromImage(qimg)
+            if self.cache:
+                st = os.stat(path)
+                cached, fresh = self.cache.get(path, self.thumb_size, st)
+                if cached:
+                    # show the cached thumbnail right away, even if it is stale
+                    self.signals.thumbnail_ready.emit(gen, ImageRecord(path, st, {}, cached))
+                if fresh:
+                    self.signals.thumbnail_done.emit(gen, path)
+                    return
+
+            if self.session.is_cancelled():
+                return
+            record = read_image(path, self.thumb_size)
+            if self.cache:
+                self.cache.put(path, self.thumb_size, record.stat, record.image, record.exif)
+            self.signals.thumbnail_ready.emit(gen, record)
         except Exception as e: 
-            logger.error(f"Load error {self.path}: {e}")
+            logger.error(f"Load error {path}: {e}")
 
-        self.signals.thumbnail_ready.emit(self.path,pix,exif_data)
-        self.signals.progress.emit(int(self.idx/self.total*100))
+        self.signals.thumbnail_done.emit(gen, path)
 
 
 
 class ImageBrowser(QWidget):
+    # all queued saves are done
+    saves_finished = pyqtSignal()
+
     def __init__(self, status_bar, icon_color, parent=None):
         super().__init__(parent)
         self.status_bar = status_bar
-        self.pool = QThreadPool.globalInstance()
+        # own pool, so cancelling a session does not touch other work
+        self.pool = QThreadPool(self)
         self.pool.setMaxThreadCount(os.cpu_count())
 
         self.ascending = True
         self.last_sort_key = 'name'
+        # key the current order is sorted by, None after manual reordering
+        self.sorted_by = None
         self.icon_color = icon_color
         self.selected: Set[ExifImage] = set()
-        self.exif_images: List[ExifImage] = []
+        self.images = ImageCollection()
+        # images in display order
+        self.exif_images: List[ExifImage] = self.images.order
+        # pixmaps of far off-screen images are dropped and reloaded from the cache
+        self.pixmaps = PixmapBudget()
+        # worker results waiting for the next insert
+        self.pending_records: List[ImageRecord] = []
+        self.pending_thumbnails: List[ImageRecord] = []
+        self.loading = False
+        self.scanning = False
+        self.session = LoadSession(0)
+        # owned by the browser and created after the pools, so they are
+        # deleted only once the pools have waited for their tasks
+        self.signals = WorkerSignals(self)
+        self.signals.metadata_ready.connect(self.add_images)
+        self.signals.scan_done.connect(self.on_scan_done)
+        self.signals.thumbnail_ready.connect(self.set_thumbnail)
+        self.signals.thumbnail_done.connect(self.on_thumbnail_done)
+        self.progress = QProgressBar()
+        self.progress.hide()
+        self.status_bar.addPermanentWidget(self.progress)
+        # saves run on their own pool, next to loading
+        self.save_pool = QThreadPool(self)
+        self.save_pool.setMaxThreadCount(SAVE_THREADS)
+        self.saving: Set[ExifImage] = set()
+        self.save_signals = SaveSignals(self)
+        self.save_signals.saved.connect(self.on_image_saved)
+        self.save_progress = QProgressBar()
+        self.save_progress.hide()
+        self.status_bar.addPermanentWidget(self.save_progress)
+        self.insert_timer = QTimer(self)
+        self.insert_timer.setSingleShot(True)
+        self.insert_timer.setInterval(INSERT_INTERVAL)
+        self.insert_timer.timeout.connect(self.insert_pending)
+        self.reprioritize_timer = QTimer(self)
+        self.reprioritize_timer.setSingleShot(True)
+        self.reprioritize_timer.setInterval(REPRIORITIZE_INTERVAL)
+        self.reprioritize_timer.timeout.connect(self.reprioritize_thumbnails)
+        try:
+            self.thumb_cache = ThumbnailCache()
+        except Exception as e:
+            logger.warning(f"Thumbnail cache disabled: {e}")
+            self.thumb_cache = None
 
         layout = QVBoxLayout(self)
 
@@ -97,9 +311,16 @@ class ImageBrowser(QWidget):
         # Load folder button
         icon = load_svg_icon("svg/plus-folder.svg", self.toolbar_browser.iconSize(), icon_color)
         self.act_load_photo_folder = QAction(icon, "Open folder", self)
-        self.act_load_photo_folder.triggered.connect(self.load_folder)
+        self.act_load_photo_folder.triggered.connect(lambda _: self.load_folder(False))
         self.toolbar_browser.addAction(self.act_load_photo_folder)
 
+        # Load folder with subfolders button
+        icon = load_svg_icon("svg/folder-picture.svg", self.toolbar_browser.iconSize(), icon_color)
+        self.act_load_photo_tree = QAction(icon, "Open folder tree", self)
+        self.act_load_photo_tree.setToolTip("Open a folder and all of its subfolders")
+        self.act_load_photo_tree.triggered.connect(lambda _: self.load_folder(True))
+        self.toolbar_browser.addAction(self.act_load_photo_tree)
+
         self.toolbar_browser.addSeparator()
 
         # Sort by name button
@@ -113,14 +334,14 @@ class ImageBrowser(QWidget):
         icon = load_svg_icon("svg/sort-time-file.svg", self.toolbar_browser.iconSize(), icon_color)
         self.act_sort_file_time = QAction(icon, "By file time", self)
         self.act_sort_file_time.setCheckable(True)
-        self.act_sort_name.triggered.connect(lambda _, k='file_date': self.sort_items(k))
+        self.act_sort_file_time.triggered.connect(lambda _, k='file_date': self.sort_items(k))
         self.toolbar_browser.addAction(self.act_sort_file_time)
 
         # Sort by EXIF time button
         icon = load_svg_icon("svg/sort-time-exif.svg", self.toolbar_browser.iconSize(), icon_color)
         self.act_sort_file_exif = QAction(icon, "By EXIF time", self)
         self.act_sort_file_exif.setCheckable(True)
-        self.act_sort_name.triggered.connect(lambda _, k='exif': self.sort_items(k))
+        self.act_sort_file_exif.triggered.connect(lambda _, k='exif': self.sort_items(k))
         self.toolbar_browser.addAction(self.act_sort_file_exif)
 
         # Ascending/descending sort button
@@ -144,19 +365,33 @@ class ImageBrowser(QWidget):
         self.toolbar_browser.addAction(self.act_save_changed)
 
 
-        # Thumbnail area
-        self.scroll = QScrollArea()
-        self.scroll.setWidgetResizable(True)
-        self.container = QWidget()
-        self.container.setAcceptDrops(True)
-        self.container.dragEnterEvent = self.dragEnterEvent
-        self.container.dragMoveEvent = self.dragMoveEvent
-        self.container.dropEvent = self.dropEvent
-        self.flow = FlowLayout(self.container)
-        self.container.setLayout(self.flow)
-        self.scroll.setWidget(self.container)
-
-        self.indicator = InsertionIndicator(self.container)
+        # Thumbnail grid, only the visible thumbnails are painted
+        self.model = ThumbnailModel(self.images, self)
+        self.delegate = ThumbnailDelegate(self)
+        self.grid = QListView()
+        self.grid.setModel(self.model)
+        self.grid.setItemDelegate(self.delegate)
+        self.grid.setFlow(QListView.LeftToRight)
+        self.grid.setWrapping(True)
+        self.grid.setResizeMode(QListView.Adjust)
+        self.grid.setUniformItemSizes(True)
+        self.grid.setLayoutMode(QListView.Batched)
+        self.grid.setSpacing(5)
+        self.grid.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.grid.setDragDropMode(QAbstractItemView.DragDrop)
+        self.grid.setDropIndicatorShown(False)
+        self.grid.startDrag = self.start_drag
+        self.grid.dragEnterEvent = self.dragEnterEvent
+        self.grid.dragMoveEvent = self.dragMoveEvent
+        self.grid.dragLeaveEvent = self.dragLeaveEvent
+        self.grid.dropEvent = self.dropEvent
+        self.grid.dataChanged = self.grid_data_changed
+        self.grid.selectionModel().selectionChanged.connect(self.on_selection_changed)
+        # thumbnails scrolled into view are loaded first
+        self.grid.verticalScrollBar().valueChanged.connect(self.reprioritize_timer.start)
+        self.grid.verticalScrollBar().rangeChanged.connect(self.reprioritize_timer.start)
+
+        self.indicator = InsertionIndicator(self.grid.viewport())
 
         # EXIF table
         self.exif_table = QTableWidget(0,2)
@@ -166,74 +401,157 @@ class ImageBrowser(QWidget):
         header.setSectionResizeMode(QHeaderView.Stretch)
 
         self.splitter = QSplitter(Qt.Vertical)
-        self.splitter.addWidget(self.scroll)
+        self.splitter.addWidget(self.grid)
         self.splitter.addWidget(self.exif_table)
         layout.addWidget(self.splitter)
 
 
-    def add_thumbnail(self, path: str, pix: QPixmap, exif: Dict[str, Any]):
-        exif_img = ExifImage(path, exif)
-        thumb = ThumbnailWidget(exif_img, pix)
-        thumb.mousePressEvent = lambda e, w=thumb: self.toggle_select(w)
-        self.flow.addWidget(thumb)
-        self.exif_images.append(exif_img)
-        self.update_exif_table()
+    def is_current(self, generation: int) -> bool:
+        """ False for results of a cancelled loading session. """
+        return generation == self.session.generation and not self.session.is_cancelled()
 
-    def toggle_select(self, thmbnl: ThumbnailWidget):
-        img = next((i for i in self.exif_images if i.path == thmbnl.exif_image.path), None)
-        if not img: return
-        if QApplication.keyboardModifiers() & Qt.ControlModifier:
-            img in self.selected and self.selected.remove(img) or self.selected.add(img)
+    def add_images(self, generation: int, records: List[ImageRecord]):
+        """ List images from their metadata, the thumbnails follow later. """
+        if not self.is_current(generation):
+            return
+        self.total += len(records)
+        self.pending_records.extend(records)
+        if not self.insert_timer.isActive():
+            self.insert_timer.start()
+
+    def set_thumbnail(self, generation: int, record: ImageRecord):
+        if not self.is_current(generation):
+            return
+        self.pending_thumbnails.append(record)
+        if not self.insert_timer.isActive():
+            self.insert_timer.start()
+
+    def insert_pending(self):
+        """
+        Insert everything the workers delivered since the last call in one
+        go: one row insert, one repaint and a single layout pass per frame.
+        """
+        if self.pending_records:
+            records, self.pending_records = self.pending_records, []
+            images = [ExifImage(record.path, record.exif, record.file_date) for record in records]
+            self.model.append_images(images)
+            self.sorted_by = None
+            self.queue_thumbnails(images)
+
+        if self.pending_thumbnails:
+            records, self.pending_thumbnails = self.pending_thumbnails, []
+            for record in records:
+                img = self.images.get(record.path)
+                if img and not record.image.isNull():
+                    self.pixmaps.set_pixmap(img, QPixmap.fromImage(record.image))
+            self.model.images_changed()
+            self.evict_pixmaps()
+
+    def queue_thumbnails(self, images: List[ExifImage]):
+        """ Load thumbnails in the background, the ones closest to the viewport first. """
+        priority = self.thumbnail_priority()
+        for _ in range(self.session.queue.push([(priority(img.path), img.path) for img in images])):
+            self.pool.start(LoadTask(QSize(100,100),self.session,self.signals,self.thumb_cache))
+
+    def evict_pixmaps(self):
+        count = self.pixmaps.evict(self.images, *visible_rows(self.grid))
+        if count:
+            logger.debug(f"Thumbnails: {count} evicted, {self.pixmaps.held / 2**20:.1f} MB held, "
+                         f"{self.pixmaps.evictions} evictions and {self.pixmaps.reloads} reloads in total")
+
+    def thumbnail_priority(self) -> Callable[[str], int]:
+        """ Priority of an image: 0 if it is visible, else its distance in rows from the viewport. """
+        first, last = visible_rows(self.grid)
+        def priority(path: str) -> int:
+            img = self.images.get(path)
+            row = self.images.row(img) if img else -1
+            if row < 0:
+                # removed from the browser, load last
+                return len(self.images)
+            return max(first - row, row - last, 0)
+        return priority
+
+    def reprioritize_thumbnails(self):
+        """ After scrolling, load what is now visible first and reload evicted thumbnails coming into view. """
+        if self.session.is_cancelled():
+            return
+        if len(self.session.queue):
+            self.session.queue.reprioritize(self.thumbnail_priority())
+        reloads = self.pixmaps.reload_requests(self.images, *visible_rows(self.grid))
+        if reloads:
+            self.queue_thumbnails(reloads)
+        self.evict_pixmaps()
+
+    def grid_data_changed(self, top_left, bottom_right, roles=[]):
+        # all items have the same size, so a change only needs a repaint; QListView
+        # would lay out every item again and reset the scroll position while doing so
+        if top_left == bottom_right:
+            self.grid.update(top_left)
         else:
-            self.selected = {img}
-        self.refresh_thumbnails()
+            self.grid.viewport().update()
+
+    def on_scan_done(self, generation: int):
+        if not self.is_current(generation):
+            return
+        self.scanning = False
+        self.update_progress()
+
+    def on_thumbnail_done(self, generation: int, path: str):
+        if not self.is_current(generation) or self.pixmaps.reload_done(path):
+            return
+        self.done += 1
+        self.update_progress()
+
+    def update_progress(self):
+        if not self.loading:
+            return
+        self.progress.setValue(int(self.done / max(self.total, 1) * 100))
+        if self.scanning or self.done < self.total:
+            return
+        # loading stopped
+        self.loading = False
+        self.insert_pending()
+        self.progress.hide()
+        if self.thumb_cache:
+            self.thumb_cache.flush()
+        self.update_exif_table()
+
+    def on_selection_changed(self, selected, deselected):
+        # apply the difference only, the view repaints the affected items itself
+        for index in deselected.indexes():
+            self.selected.discard(self.images[index.row()])
+        for index in selected.indexes():
+            self.selected.add(self.images[index.row()])
+        self.update_exif_table()
+
+    def target_images(self) -> List[ExifImage]:
+        """ Selected images in display order, or all images if none are selected. """
+        if self.selected:
+            return sorted(self.selected, key=self.images.row)
+        return list(self.exif_images)
+
+    def apply_exif_updates(self, updates: List[Tuple[ExifImage, Dict[int, Any]]]):
+        """ Update many images at once and refresh the view a single time. """
+        for img, exif_update in updates:
+            img.update_exif(exif_update)
+        self.refresh_thumbnails([img for img, _ in updates])
         self.update_exif_table()
 
-    def refresh_thumbnails(self):
-        for img in self.exif_images:
-            sel = img in self.selected
-            chg = img.has_changes()
-            style = ('background: gray;' if sel else 'background: none;',
-                    'border:1px solid red;' if chg else 'border:1px solid gray;')
-            img.widget.setStyleSheet(''.join(style))
+    def refresh_thumbnails(self, images: List[ExifImage]):
+        """ Repaint the thumbnails of images whose EXIF data or changed state was modified. """
+        self.model.some_images_changed(images)
 
     def sort_items(self, key: str):
         self.last_sort_key = key
-        items: List[Tuple[Any, ExifImage]] = []
-        for img in self.exif_images:
-            if key == 'name':
-                val = img.name
-            elif key == 'file_date':
-                val = img.file_date
-            else:
-                val = img.exif_current.get('DateTimeOriginal') or img.exif_current.get('DateTime', '')
-            items.append((val, img))
-        items.sort(key=lambda x: x[0], reverse=not self.ascending)
-
-        # Update internal order
-        self.exif_images = [img for _, img in items]
-
-        # Rebuild layout
-        while self.flow.count():
-            w = self.flow.takeAt(0).widget()
-            w.setParent(None)
-        for img in self.exif_images:
-            self.flow.addWidget(img.widget)
-
-        # disable slog/signals before setting checked state
-        self.act_sort_name.triggered.disconnect()
-        self.act_sort_file_time.triggered.disconnect()
-        self.act_sort_file_exif.triggered.disconnect()
-
-        # Update sort action states
+        # keys are precomputed per image, the view only gets a new order
+        order = sorted(self.exif_images, key=lambda img: img.sort_keys[key], reverse=not self.ascending)
+        self.model.set_order(order)
+        self.sorted_by = key
+
+        # setChecked does not emit triggered
         self.act_sort_name.setChecked(key == 'name')
         self.act_sort_file_time.setChecked(key == 'file_date')
         self.act_sort_file_exif.setChecked(key == 'exif')
-        
-        # re-enable signals
-        self.act_sort_name.triggered.connect(lambda _, k='name': self.sort_items(k))
-        self.act_sort_file_time.triggered.connect(lambda _, k='file_date': self.sort_items(k))
-        self.act_sort_file_exif.triggered.connect(lambda _, k='exif': self.sort_items(k))
 
     def toggle_order(self, asc: bool):
         self.ascending = not self.ascending
@@ -245,14 +563,18 @@ class ImageBrowser(QWidget):
                 self.icon_color
             )
         )
-        self.sort_items(self.last_sort_key)
+        if self.sorted_by == self.last_sort_key:
+            # already sorted, the other direction is the reverse order
+            self.model.set_order(self.exif_images[::-1])
+        else:
+            self.sort_items(self.last_sort_key)
 
     def on_exif_item_changed(self, item: QTableWidgetItem):
         if item.column() != 1 or not self.selected: return
-        tag = self.exif_table.item(item.row(), 0).text()
+        tag = self.exif_table.item(item.row(), 0).data(Qt.UserRole)
         val = item.text()
-        for img in self.selected: img.exif_current[tag] = val
-        self.refresh_thumbnails()
+        for img in self.selected: img.update_exif({tag: val})
+        self.refresh_thumbnails(list(self.selected))
         item.setBackground(
             QColor('#ea2055') if any(i.exif_current.get(tag) != i.exif_original.get(tag) for i in self.selected)
             else QColor('#101012')
@@ -281,6 +603,7 @@ class ImageBrowser(QWidget):
         for i, (k, v, ch) in enumerate(rows):
             kkk = ExifTags.TAGS.get(k, k)
             ik = QTableWidgetItem(kkk)
+            ik.setData(Qt.UserRole, k)
             iv = QTableWidgetItem(v)
             iv.setFlags(iv.flags() | Qt.ItemIsEditable)
             bg = QColor('#ea2055') if ch else QColor('#101012')
@@ -288,210 +611,232 @@ class ImageBrowser(QWidget):
             self.exif_table.setItem(i, 0, ik); self.exif_table.setItem(i, 1, iv)
         self.exif_table.blockSignals(False)
 
-    def load_folder(self):
+    def load_folder(self, recursive: bool=False):
         dlg = QFileDialog(self); dlg.setFileMode(QFileDialog.Directory)
         if dlg.exec_():
             folder = dlg.selectedFiles()[0]
-            folder = os.path.abspath(folder)
-            imgs = [os.path.join(folder, f) for f in os.listdir(folder)
-                    if f.lower().endswith(('.jpg','.jpeg','.png','.tiff','.gif'))]
-            self.start_loading(imgs)
+            # the folder is scanned by the worker, images show up as they are found
+            self.start_loading([os.path.abspath(folder)], recursive)
 
     def add_files(self):
         files, _ = QFileDialog.getOpenFileNames(self, 'Select Images', '',
-                                                'Images (*.jpg *.jpeg *.png *.tiff *.gif)')
+                                                'Images (%s)' % ' '.join('*' + ext for ext in IMAGE_EXTS))
         if files: self.start_loading(files)
 
-    def start_loading(self, paths:List[str]):
-        # clear prev
-        self.exif_images.clear(); self.selected.clear()
+    def start_loading(self, paths:List[str], recursive:bool=False):
+        # stop the previous session and clear
+        self.cancel_loading()
+        self.model.clear(); self.selected.clear(); self.pixmaps.clear()
+        self.session = LoadSession(self.session.generation + 1, self.pool.maxThreadCount())
         # progress bar
-        self.progress=QProgressBar()
         self.progress.setValue(0)
-        self.status_bar.addPermanentWidget(self.progress)
-        # signals
-        self.signals=WorkerSignals()
-        self.signals.progress.connect(self.progress.setValue)
-        self.signals.thumbnail_ready.connect(self.add_thumbnail)
-        self.signals.progress.connect(lambda v: v)
-        self.signals.progress.connect(lambda v: self.status_bar.removeWidget(self.progress) if v>=100 else None)
-        total=len(paths)
-        for idx,p in enumerate(paths,1):
-            self.pool.start(LoadTask(p,QSize(100,100),idx,total,self.signals))
+        self.progress.show()
+        # metadata first, thumbnails are queued as the images are listed
+        # the total grows while the worker finds images
+        self.loading, self.scanning, self.done, self.total = True, True, 0, 0
+        self.pool.start(MetadataTask(paths,recursive,self.session,self.signals,self.thumb_cache))
+        self.update_progress()
+
+    def cancel_loading(self):
+        """
+        Stop the current session: queued tasks and images are dropped,
+        running tasks return at their next check and late results are ignored.
+        """
+        self.session.cancel()
+        self.pool.clear()
+        self.insert_timer.stop()
+        self.reprioritize_timer.stop()
+        self.pending_records.clear()
+        self.pending_thumbnails.clear()
+        if self.loading:
+            self.loading = False
+            self.progress.hide()
+            if self.thumb_cache:
+                self.thumb_cache.flush()
+
+    def shutdown(self):
+        """
+        Stop loading and wait for all workers, saves included, before the
+        window is torn down, so no task outlives the signals it reports to.
+        """
+        self.cancel_loading()
+        self.pool.waitForDone()
+        self.save_pool.waitForDone()
+        if self.thumb_cache:
+            self.thumb_cache.close()
+            self.thumb_cache = None
     
     def save_selected_images(self):
-        for img in list(self.selected):
-            if img.save_exif(): self.refresh_thumbnails()
-        self.update_exif_table()
+        self.save_images(sorted(self.selected, key=self.images.row))
 
     def save_all_changed_images(self):
-        for img in self.exif_images:
-            if img.has_changes(): 
-                img.save_exif()
-        self.update_exif_table()
+        self.save_images([img for img in self.exif_images if img.has_changes()])
+
+    def save_images(self, images: List[ExifImage]):
+        """
+        Queue images for saving in the background, the browser stays usable.
+        Images already being saved are skipped, later edits need another save.
+        """
+        images = [img for img in images if img not in self.saving]
+        if not images:
+            return
+        if not self.saving:
+            self.save_started = time.monotonic()
+            self.save_done, self.save_failed, self.save_total = 0, 0, 0
+        self.save_total += len(images)
+        for img in images:
+            self.saving.add(img)
+            self.save_pool.start(SaveTask(img, img.exif_current.copy(), self.save_signals))
+        self.update_save_progress()
+
+    def is_saving(self) -> bool:
+        return bool(self.saving)
+
+    def on_image_saved(self, img: ExifImage, exif: Dict[int, Any], skipped: Dict[int, str], error: str):
+        self.saving.discard(img)
+        self.save_done += 1
+        if error:
+            img.save_error = error
+            self.save_failed += 1
+        elif not img.mark_saved(exif, skipped):
+            self.save_failed += 1
+        self.model.image_changed(img)
+        if img in self.selected:
+            self.update_exif_table()
+        self.update_save_progress()
+
+    def update_save_progress(self):
+        if self.saving:
+            elapsed = time.monotonic() - self.save_started
+            rate = self.save_done / elapsed if elapsed > 0 else 0
+            text = "Saving %v of %m"
+            if rate > 0:
+                eta = (self.save_total - self.save_done) / rate
+                text += f", {rate:.1f} files/s, {eta:.0f} s left"
+            self.save_progress.setMaximum(self.save_total)
+            self.save_progress.setValue(self.save_done)
+            self.save_progress.setFormat(text)
+            self.save_progress.show()
+            return
+
+        self.save_progress.hide()
+        message = f"Saved {self.save_done - self.save_failed} of {self.save_total} images"
+        if self.save_failed:
+            message += f", {self.save_failed} failed"
+        self.status_bar.showMessage(message, 10000)
+        self.saves_finished.emit()
 
     def closeEvent(self, e):
-        # ensure thread stops
-        if hasattr(self, 'loader') and self.loader.isRunning():
-            self.loader.terminate()
+        # ensure loading stops
+        self.cancel_loading()
         super().closeEvent(e)
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_Delete:
-            for img in list(self.selected):
-                self.exif_images.remove(img)
-                img.widget.deleteLater()
+            self.pixmaps.forget(self.selected)
+            self.model.remove_images(list(self.selected))
             self.selected.clear()
-            self.refresh_thumbnails()
             self.update_exif_table()
             event.accept()
         elif event.key() == Qt.Key_Escape:
-            self.selected.clear()
-            self.refresh_thumbnails()
-            self.update_exif_table()
+            self.grid.clearSelection()
             event.accept()
         elif event.key() == Qt.Key_A and event.modifiers() & Qt.ControlModifier:
             # Select all images
-            self.selected = set(self.exif_images)
-            self.refresh_thumbnails()
-            self.update_exif_table()
+            self.grid.selectAll()
             event.accept()
         else:
             super().keyPressEvent(event)
 
+    def start_drag(self, supported_actions):
+        # drag one image, the path identifies it on drop
+        index = self.grid.currentIndex()
+        if not index.isValid():
+            return
+        drag = QDrag(self.grid)
+        mime = QMimeData()
+        mime.setText(self.images[index.row()].path)
+        drag.setMimeData(mime)
+        drag.exec_(Qt.MoveAction)
+
+    def set_drop_row(self, row: int):
+        """ Highlight the thumbnail a roll frame would be dropped on. """
+        if row == self.delegate.drop_row:
+            return
+        for r in (self.delegate.drop_row, row):
+            if r >= 0:
+                self.grid.update(self.model.index(r))
+        self.delegate.drop_row = row
+
+    def dropped_paths(self, mime: QMimeData) -> List[str]:
+        """ Local files and folders dropped from a file manager. """
+        if not mime.hasUrls():
+            return []
+        return [url.toLocalFile() for url in mime.urls() if url.isLocalFile()]
+
     def dragEnterEvent(self, event):
         if (event.mimeData().hasFormat('application/x-roll-frame-exif') or 
-            event.mimeData().hasText()):
+            event.mimeData().hasText() or self.dropped_paths(event.mimeData())):
             event.acceptProposedAction()
 
     def dragMoveEvent(self, event):
+        if self.dropped_paths(event.mimeData()):
+            self.indicator.hide()
+            event.acceptProposedAction()
+            return
         if event.mimeData().hasFormat('application/x-roll-frame-exif'):
             self.indicator.hide()
             event.acceptProposedAction()
-
-            pos = event.pos()
-            for img in self.exif_images:
-                chg = img.has_changes()
-                style = ('background: gray;' if img.widget.geometry().contains(pos) else 'background: none;',
-                        'border:1px solid red;' if chg else 'border:1px solid gray;')
-                img.widget.setStyleSheet(''.join(style))
+            self.set_drop_row(grid_slot(self.grid, event.pos())[0])
             return
-        
-        # 1) mouse pos *in* the container’s coords
-        pos = event.pos()
-
-        # 2) all thumbs in true order
-        thumbs = [img.widget for img in self.exif_images]
-
-        # 3) pick out just the ones under this y (same "row")
-        row = [w for w in thumbs
-            if w.y() <= pos.y() <= w.y() + w.height()]
 
-        if not row:
-            # if you aren't over a thumbnail‐row, hide marker
+        _, insert_at, marker = grid_slot(self.grid, event.pos())
+        if insert_at < 0:
+            # if you aren't over a thumbnail, hide marker
             self.indicator.hide()
             return
-
-        # 4) sort that row left→right
-        row.sort(key=lambda w: w.x())
-
-        # 5) find insert point
-        insert_at = None
-        ref_widget = None
-        for w in row:
-            mid = w.x() + w.width() / 2
-            if pos.x() < mid:
-                insert_at = thumbs.index(w)
-                ref_widget = w
-                break
-        if insert_at is None:
-            # past the last in the row
-            ref_widget = row[-1]
-            insert_at = thumbs.index(ref_widget) + 1
-
-        # 6) compute the indicator’s geometry
-        geo = ref_widget.geometry()
-        # put it on the left edge if inserting before, else on the right
-        x = geo.x() if insert_at <= thumbs.index(ref_widget) else geo.x() + geo.width()
-        y = geo.y()
-        h = geo.height()
-
-        # center the 4px‐wide bar on that x
-        self.indicator.setGeometry(x - 2, y, 4, h)
+        event.acceptProposedAction()
+        self.indicator.setGeometry(marker)
         self.indicator.show()
 
+    def dragLeaveEvent(self, event):
+        self.indicator.hide()
+        self.set_drop_row(-1)
+
     def dropEvent(self, event):
         mime = event.mimeData()
+        self.indicator.hide()
+        self.set_drop_row(-1)
         if mime.hasFormat('application/x-roll-frame-exif'):
             # Handle EXIF update from roll table
             data = mime.data('application/x-roll-frame-exif')
             exif_update = pickle.loads(data.data())
-            pos = event.pos()
-            target_thumb = None
-            for img in self.exif_images:
-                if img.widget.geometry().contains(pos):
-                    target_thumb = img
-                    break
-
-            if target_thumb:
-                target_thumb.exif_current.update(exif_update)
-                self.refresh_thumbnails()
-                self.update_exif_table()
-                target_thumb.widget.update_exif()
-                event.accept()
-            else:
+            row, _, _ = grid_slot(self.grid, event.pos())
+            if row < 0:
                 event.ignore()
-        else:
-            # 1) Only handle our own internal drags (we encoded the image path as plain text)
-            mimimii = event.mimeData()
-            if not event.mimeData().hasText():
                 return
-            event.acceptProposedAction()
 
-            # 2) Figure out where to insert
-            pos = event.pos()
-            thumbs = [img.widget for img in self.exif_images]
-            # find all widgets on the same “row” (y-span) as the drop point
-            row = [w for w in thumbs
-                if w.y() <= pos.y() <= w.y() + w.height()]
-            if not row:
-                # if you aren’t over any row, just hide the indicator and bail
-                self.indicator.hide()
-                return
+            target = self.images[row]
+            target.update_exif(exif_update)
+            self.model.image_changed(target)
+            self.update_exif_table()
+            event.accept()
+            return
 
-            row.sort(key=lambda w: w.x())
-            # default to end-of-row
-            insert_at = None
-            for w in row:
-                mid = w.x() + w.width() / 2
-                if pos.x() < mid:
-                    insert_at = thumbs.index(w)
-                    break
-            if insert_at is None:
-                insert_at = thumbs.index(row[-1]) + 1
-
-            # 3) Find which image was dragged by matching the text payload (= file path)
-            path = event.mimeData().text()
-            old_index = next((i for i,img in enumerate(self.exif_images)
-                            if img.path == path), None)
-            if old_index is None:
-                self.indicator.hide()
-                return
-            dragged = self.exif_images.pop(old_index)
-
-            # 4) Re-insert into our model list
-            #    adjust insert_at if removing something before the new position
-            if old_index < insert_at:
-                insert_at -= 1
-            self.exif_images.insert(insert_at, dragged)
-
-            # 5) Rebuild the flow layout in the new order
-            while self.flow.count():
-                item = self.flow.takeAt(0)
-                w = item.widget()
-                w.setParent(None)
-            for img in self.exif_images:
-                self.flow.addWidget(img.widget)
-
-            # 6) Hide the insertion indicator now that we’ve dropped
-            self.indicator.hide()
+        paths = self.dropped_paths(mime)
+        if paths:
+            # files and folders from a file manager, folders with all subfolders
+            event.acceptProposedAction()
+            self.start_loading(paths, recursive=True)
+            return
+
+        # Only handle our own internal drags (we encoded the image path as plain text)
+        if not mime.hasText():
+            return
+        _, insert_at, _ = grid_slot(self.grid, event.pos())
+        dragged = self.images.get(mime.text())
+        if insert_at < 0 or dragged is None:
+            return
+        event.acceptProposedAction()
+        self.model.move_image(self.images.row(dragged), insert_at)
+        self.sorted_by = None
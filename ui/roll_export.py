@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+
+import os
+from typing import List, Tuple
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from util import *
+from rolldata import RollData, roll_filename
+
+
+
+class ExportSignals(QObject):
+    done=pyqtSignal(str,str)   # path, error message ('' on success)
+
+
+
+class ExportTask(QRunnable):
+    def __init__(self, roll: RollData, path: str, extension: str, signals: ExportSignals):
+        super().__init__()
+        self.roll, self.path, self.extension, self.signals = roll, path, extension, signals
+
+    def run(self):
+        error = ''
+        try:
+            if self.extension == 'csv':
+                self.roll.save_csv(self.path)
+            else:
+                self.roll.save_json(self.path)
+        except Exception as e:
+            logger.error(f"Export error {self.path}: {e}")
+            error = str(e)
+        self.signals.done.emit(self.path, error)
+
+
+
+class RollExporter(QObject):
+    """
+    Writes a batch of rolls in the background.
+
+    Every roll is saved by its own task on a private thread pool, files are
+    written atomically by RollData. Progress is reported for the whole
+    batch and all failures are collected into a single report.
+    """
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(list)     # list of (path, error) tuples
+
+    def __init__(self, max_threads: int=4, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.signals = ExportSignals()
+        self.signals.done.connect(self.on_done)
+        self.total  = 0
+        self.count  = 0
+        self.errors: List[Tuple[str, str]] = []
+
+    def is_running(self) -> bool:
+        return self.count < self.total
+
+    def export(self, rolls: List[RollData], folder: str, extension: str='json'):
+        self.total  = len(rolls)
+        self.count  = 0
+        self.errors = []
+        if not rolls:
+            self.finished.emit([])
+            return
+
+        used = set()
+        for roll in rolls:
+            path = os.path.join(folder, roll_filename(roll, extension, used))
+            self.pool.start(ExportTask(roll, path, extension, self.signals))
+
+    def on_done(self, path: str, error: str):
+        self.count += 1
+        if error:
+            self.errors.append((path, error))
+        self.progress.emit(int(self.count / self.total * 100))
+        if self.count == self.total:
+            logger.debug(f"Exported {self.total - len(self.errors)} of {self.total} rolls")
+            self.finished.emit(self.errors)
@@ -3,26 +3,182 @@
 
 import pickle
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QHBoxLayout, QTableWidgetItem, 
-    QTableWidget, QLabel, QAbstractItemView, QLineEdit
+    QWidget, QVBoxLayout, QHBoxLayout, QTableView,
+    QLabel, QAbstractItemView, QLineEdit
 )
 
 from PyQt5.QtGui import QDrag
-from PyQt5.QtCore import Qt, QMimeData
+from PyQt5.QtCore import (
+    Qt, QMimeData, QAbstractTableModel, QModelIndex,
+    QSortFilterProxyModel
+)
 
 from util import *
 from rolldata import *
+from rollarchive import guess_frame_size
 from f90.f90 import *
 from f90.constants import *
 
 
 
+def frame_mime_data(roll: RollData, frame: Dict[Any, Any]) -> QMimeData:
+    """ Mime data for dragging a frame onto images. """
+    mime = QMimeData()
+    mime.setData('application/x-roll-frame-exif', pickle.dumps(frame_exif(roll, frame)))
+    return mime
+
+
+# header, EXIF tag, formatter
+ROLL_TABLE_COLUMNS = [
+    ("Frame",        ExifTagNames.ImageNumber,  lambda v: f"{v:02d}"),
+    ("Shutter",      ExifTagNames.Shutter,      format_exposure_time),
+    ("Aperture",     ExifTagNames.Aperture,     format_aperture),
+    ("Focal Length", ExifTagNames.FocalLength,  format_focal_length),
+    ("Exp. Mode",    ExifTagNames.ExposureMode, str),
+    ("Metering",     ExifTagNames.MeteringMode, str),
+    ("Flash Sync",   ExifTagNames.Flash,        str),
+]
+
+# tags only stored in frames of 4 bytes and more, their columns are hidden for 2 byte frames
+FOUR_BYTE_TAGS = {
+    ExifTagNames.FocalLength,
+    ExifTagNames.ExposureMode,
+    ExifTagNames.MeteringMode,
+    ExifTagNames.Flash,
+}
+
+
+
+class RollTableModel(QAbstractTableModel):
+    """
+    Table model on top of the frames of a roll.
+
+    Display strings are formatted on demand in data(). Sorting permutes a
+    row order list with keys computed once per frame, so the proxy does not
+    need to compare cells through data().
+    """
+    def __init__(self, roll: RollData=None, parent=None):
+        super().__init__(parent)
+        self.roll  = roll
+        self.order = list(range(len(roll.frames))) if roll else []
+        self.row_texts: Dict[int, str] = {}
+
+    def set_roll(self, roll: RollData):
+        self.beginResetModel()
+        self.roll  = roll
+        self.order = list(range(len(roll.frames))) if roll else []
+        self.row_texts = {}
+        self.endResetModel()
+
+    def frame(self, row: int) -> Dict[Any, Any]:
+        return self.roll.frames[self.order[row]]
+
+    def row_text(self, row: int) -> str:
+        """ Lower case display text of a whole row, used for filtering. """
+        idx = self.order[row]
+        text = self.row_texts.get(idx)
+        if text is None:
+            frame = self.roll.frames[idx]
+            text = ' '.join(self.display(frame, col) for col in range(len(ROLL_TABLE_COLUMNS))).lower()
+            self.row_texts[idx] = text
+        return text
+
+    def display(self, frame: Dict[Any, Any], column: int) -> str:
+        _, tag, fmt = ROLL_TABLE_COLUMNS[column]
+        if tag not in frame:
+            return "Unknown"
+        try:
+            return fmt(frame[tag])
+        except Exception:
+            return str(frame[tag])
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid() or not self.roll:
+            return 0
+        return len(self.order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(ROLL_TABLE_COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return ROLL_TABLE_COLUMNS[section][0]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self.display(self.frame(index.row()), index.column())
+        if role == Qt.UserRole:
+            return self.frame(index.row()).get(ROLL_TABLE_COLUMNS[index.column()][1])
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if not self.roll:
+            return
+        tag = ROLL_TABLE_COLUMNS[column][1]
+        frames = self.roll.frames
+
+        self.layoutAboutToBeChanged.emit()
+        old_order = self.order
+        self.order = sorted(range(len(frames)), key=lambda i: sort_key(frames[i].get(tag)),
+                            reverse=order == Qt.DescendingOrder)
+
+        # keep selections and other persistent indexes on their frames
+        new_rows = {idx: row for row, idx in enumerate(self.order)}
+        old_indexes = self.persistentIndexList()
+        new_indexes = [self.index(new_rows[old_order[i.row()]], i.column()) for i in old_indexes]
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
+
+
+
+class RollSortFilterProxy(QSortFilterProxyModel):
+    """
+    Filters frames by their display text. Sorting is forwarded to
+    the source model, which sorts on the raw frame values.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.needle = ""
+
+    def set_filter_text(self, text: str):
+        self.needle = text.strip().lower()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        return not self.needle or self.needle in self.sourceModel().row_text(source_row)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if column >= 0:
+            self.sourceModel().sort(column, order)
+
+
+
 class RollSummaryTable(QWidget):
     def __init__(self, roll:RollData, parent=None):
         super().__init__(parent)
         self.roll      = roll
         self.auto_hide = True
+        # child widgets are created when the tab is shown for the first time
+        self.is_built  = False
+
+
+    def showEvent(self, event):
+        if not self.is_built:
+            self.build()
+        super().showEvent(event)
+
+
+    def set_roll(self, roll:RollData):
+        self.roll = roll
+        if self.is_built:
+            self.populate()
+
 
+    def build(self):
+        self.is_built = True
         self.layout = QVBoxLayout(self)
 
         self.lbl_header = QLabel("")
@@ -37,12 +193,28 @@ class RollSummaryTable(QWidget):
         self.txt_desc.setPlaceholderText("Enter a description for this roll")
         desc_layout.addWidget(self.txt_desc)
 
+        self.txt_filter = QLineEdit(self)
+        self.txt_filter.setPlaceholderText("Filter frames")
+        self.txt_filter.setClearButtonEnabled(True)
+        self.layout.addWidget(self.txt_filter)
+
+        # Frame model, sorted and filtered through a proxy
+        self.model = RollTableModel(parent=self)
+        self.proxy = RollSortFilterProxy(self)
+        self.proxy.setSourceModel(self.model)
+        self.txt_filter.textChanged.connect(self.proxy.set_filter_text)
 
         # Main table
-        self.table = QTableWidget(self)
+        self.table = QTableView(self)
+        self.table.setModel(self.proxy)
+        # frames are already in order, don't sort until a header is clicked
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table.setSortingEnabled(True)
+        # size columns from the first rows only
+        self.table.horizontalHeader().setResizeContentsPrecision(50)
         self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)  # cells are not editable
         self.table.verticalHeader().setVisible(False)
-        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.table.setSelectionMode(QAbstractItemView.SingleSelection)
         self.layout.addWidget(self.table)
 
@@ -52,24 +224,14 @@ class RollSummaryTable(QWidget):
         self.table.setDragDropMode(QAbstractItemView.DragOnly)
 
         def startDrag_local(supported_actions):
-            selected = self.table.selectedItems()
+            selected = self.table.selectionModel().selectedRows()
             if not selected:
                 return
             
             # pickle the whole row
-            row = selected[0].row()
-            frame = self.roll.frames[row]
-
-            # use EXIF tag IDs as keys
-            exif_data = {}
-            for k, v in frame.items():
-                exif_data[k.value] = v
-            exif_data[ExifTagNames.ISO.value] = self.roll.iso
-            
-            mime = QMimeData()
-            mime.setData('application/x-roll-frame-exif', pickle.dumps(exif_data))
+            row = self.proxy.mapToSource(selected[0]).row()
             drag = QDrag(self)
-            drag.setMimeData(mime)
+            drag.setMimeData(frame_mime_data(self.roll, self.model.frame(row)))
             drag.exec_(Qt.CopyAction)
 
         # Bind our custom startDrag
@@ -82,63 +244,13 @@ class RollSummaryTable(QWidget):
             return
         
         self.setWindowTitle(f"Roll {self.roll.roll_number}")
-        self.table.setRowCount(len(self.roll.frames))
         self.lbl_header.setText(f"<b>Roll {self.roll.roll_number}</b> - ISO {self.roll.iso}, {len(self.roll.frames)} frames")
+        self.model.set_roll(self.roll)
 
-        frame_size = len(self.roll.frames[0]) if self.roll.frames else 0
-        columns = ["Frame", "Shutter", "Aperture"]
-        if frame_size >= 4:
-            columns += ["Focal Length", "Exp. Mode", "Metering", "Flash Sync"]
-        if frame_size >= 6:
-            columns.append("Compensations")
-
-            
-        self.table.setColumnCount(len(columns))
-        self.table.setHorizontalHeaderLabels(columns)
-
-        if self.roll.frames:
-            # Populate rows
-            for i, frame in enumerate(self.roll.frames):
-                # MINIMUM STORAGE MODE (2 bytes)
-                shutter = frame[ExifTagNames.Shutter]
-                aperture = frame[ExifTagNames.Aperture]
-                items = [
-                    QTableWidgetItem(f"{frame[ExifTagNames.ImageNumber]:02d}"),
-                    QTableWidgetItem(f"{format_exposure_time(shutter)}"),
-                    QTableWidgetItem(f"{format_aperture(aperture)}"),
-                ]
-
-                # FOUR BYTE STORAGE MODE
-                if ExifTagNames.FocalLength in frame:
-                    items.append(QTableWidgetItem(f"{frame[ExifTagNames.FocalLength]} mm"))
-                else:
-                    items.append(QTableWidgetItem("Unknown"))
-                
-                if ExifTagNames.ExposureMode in frame:
-                    items.append(QTableWidgetItem(frame[ExifTagNames.ExposureMode]))
-                else:
-                    items.append(QTableWidgetItem("Unknown"))
-
-                if ExifTagNames.MeteringMode in frame:
-                    items.append(QTableWidgetItem(frame[ExifTagNames.MeteringMode]))
-                else:
-                    items.append(QTableWidgetItem("Unknown"))
-                
-                if ExifTagNames.Flash in frame:
-                    items.append(QTableWidgetItem(frame[ExifTagNames.Flash]))
-                else:
-                    items.append(QTableWidgetItem("Unknown"))
-
-                # SIX BYTE STORAGE MODE
-                # if show_extra:
-                #     ec = parse_exposure_compensation(payload[4])
-                #     fc = parse_exposure_compensation(payload[5])
-                #     items.append(QTableWidgetItem(f"EC={ec}, FC={fc}"))
-
-                for col, item in enumerate(items):
-                    self.table.setItem(i, col, item)
-
-            self.table.resizeColumnsToContents()
+        frame_size = self.roll.frame_size or guess_frame_size(self.roll.frames)
+        for col, (_, tag, _) in enumerate(ROLL_TABLE_COLUMNS):
+            self.table.setColumnHidden(col, frame_size < 4 and tag in FOUR_BYTE_TAGS)
+        self.table.resizeColumnsToContents()
         
 
 
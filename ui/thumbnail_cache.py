@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+#
+# Persistent thumbnail cache.
+#
+# One SQLite file holds the encoded thumbnail and the EXIF tags used by the
+# image browser for every image that was opened before, so reopening a
+# folder neither decodes nor parses unchanged files. Entries are looked up
+# by path and thumbnail size and are only valid while mtime, inode and file
+# size still match. The least recently used entries are dropped once the
+# cache grows beyond its size limit.
+
+import os
+import time
+import pickle
+import sqlite3
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from PyQt5.QtGui import QImage
+from PyQt5.QtCore import QSize, QBuffer, QByteArray, QIODevice, QStandardPaths
+
+from util import *
+
+
+CACHE_FILE       = 'thumbnails.sqlite'
+CACHE_LIMIT      = 256 * 1024 * 1024    # bytes
+CACHE_LOW_WATER  = 0.9                  # evict down to 90% of the limit
+TOUCH_BATCH      = 200                  # last used updates written at once
+SCHEMA_VERSION   = 3                    # caches of other versions are dropped
+
+
+
+def default_cache_dir() -> str:
+    base = QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation)
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'EXIFilm')
+
+
+def file_signature(st: os.stat_result) -> Tuple[int, int, int]:
+    """ Values that change whenever a file is rewritten or replaced. """
+    return st.st_mtime_ns, st.st_ino, st.st_size
+
+
+
+class ThumbnailCache:
+    """
+    Thread safe on-disk cache of thumbnails and EXIF tags.
+
+    `get` returns the cached thumbnail and whether it is still
+    valid for the file on disk. Stale entries are returned as well, so the
+    caller can show them right away while the image is decoded again.
+    `get_exif` only returns tags that are still valid.
+    """
+    def __init__(self, folder: Optional[str]=None, limit: int=CACHE_LIMIT):
+        self.folder = folder or default_cache_dir()
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.touched: Dict[Tuple[str, int, int], float] = {}
+
+        os.makedirs(self.folder, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(self.folder, CACHE_FILE), check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            self.db.execute('DROP TABLE IF EXISTS thumbs')
+            self.db.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS thumbs (
+                path      TEXT    NOT NULL,
+                width     INTEGER NOT NULL,
+                height    INTEGER NOT NULL,
+                mtime_ns  INTEGER NOT NULL,
+                inode     INTEGER NOT NULL,
+                file_size INTEGER NOT NULL,
+                last_used REAL    NOT NULL,
+                bytes     INTEGER NOT NULL,
+                image     BLOB    NOT NULL,
+                exif      BLOB    NOT NULL,
+                PRIMARY KEY (path, width, height)
+            )""")
+        self.db.execute('CREATE INDEX IF NOT EXISTS thumbs_lru ON thumbs (last_used)')
+        self.db.commit()
+        self.total = self.db.execute('SELECT COALESCE(SUM(bytes), 0) FROM thumbs').fetchone()[0]
+
+
+    def get(self, path: str, size: QSize, st: os.stat_result) -> Tuple[Optional[QImage], bool]:
+        """ (thumbnail or None, entry is up to date) """
+        key = (os.path.abspath(path), size.width(), size.height())
+        with self.lock:
+            row = self.db.execute(
+                'SELECT mtime_ns, inode, file_size, image FROM thumbs '
+                'WHERE path=? AND width=? AND height=?', key).fetchone()
+            if row is None:
+                return None, False
+            self.touched[key] = time.time()
+            if len(self.touched) >= TOUCH_BATCH:
+                self._flush()
+
+        qimg = QImage.fromData(row[3])
+        if qimg.isNull():
+            logger.debug(f"Broken cache entry for {path}")
+            return None, False
+        return qimg, tuple(row[:3]) == file_signature(st)
+
+
+    def get_exif(self, path: str, st: os.stat_result) -> Optional[Dict[int, Any]]:
+        """ EXIF tags stored with any thumbnail of the file, None if there is no up to date entry. """
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT mtime_ns, inode, file_size, exif FROM thumbs WHERE path=?',
+                (os.path.abspath(path),)).fetchall()
+        signature = file_signature(st)
+        for row in rows:
+            if tuple(row[:3]) == signature:
+                try:
+                    return pickle.loads(row[3])
+                except Exception as e:
+                    logger.debug(f"Broken cache entry for {path}: {e}")
+        return None
+
+
+    def put(self, path: str, size: QSize, st: os.stat_result, qimg: QImage, exif: Dict[int, Any]):
+        if qimg.isNull():
+            return
+        data = QByteArray()
+        buf = QBuffer(data)
+        buf.open(QIODevice.WriteOnly)
+        # thumbnails with alpha keep it, everything else is stored as JPEG
+        qimg.save(buf, 'PNG' if qimg.hasAlphaChannel() else 'JPEG', 90)
+        image = bytes(data)
+        try:
+            blob = pickle.dumps(exif)
+        except Exception as e:
+            logger.debug(f"EXIF of {path} is not cached: {e}")
+            return
+
+        key = (os.path.abspath(path), size.width(), size.height())
+        nbytes = len(image) + len(blob)
+        with self.lock:
+            old = self.db.execute(
+                'SELECT bytes FROM thumbs WHERE path=? AND width=? AND height=?', key).fetchone()
+            self.db.execute(
+                'INSERT OR REPLACE INTO thumbs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                key + file_signature(st) + (time.time(), nbytes, image, blob))
+            self.touched.pop(key, None)
+            self.total += nbytes - (old[0] if old else 0)
+            if self.total > self.limit:
+                self._evict()
+            self.db.commit()
+
+
+    def flush(self):
+        """ Write pending last used times, e.g. after a folder was loaded. """
+        with self.lock:
+            self._flush()
+
+
+    def clear(self):
+        with self.lock:
+            self.db.execute('DELETE FROM thumbs')
+            self.db.commit()
+            self.touched.clear()
+            self.total = 0
+
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.db.close()
+
+
+    def _flush(self):
+        if not self.touched:
+            return
+        self.db.executemany(
+            'UPDATE thumbs SET last_used=? WHERE path=? AND width=? AND height=?',
+            [(t,) + key for key, t in self.touched.items()])
+        self.db.commit()
+        self.touched.clear()
+
+
+    def _evict(self):
+        """ Drop least recently used entries until the cache is below its low water mark. """
+        self._flush()
+        target = self.limit * CACHE_LOW_WATER
+        removed = []
+        for rowid, nbytes in self.db.execute('SELECT rowid, bytes FROM thumbs ORDER BY last_used'):
+            if self.total <= target:
+                break
+            removed.append((rowid,))
+            self.total -= nbytes
+        self.db.executemany('DELETE FROM thumbs WHERE rowid=?', removed)
+        logger.debug(f"Thumbnail cache: evicted {len(removed)} entries")
@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+#
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from PyQt5.QtWidgets import QStyledItemDelegate, QStyle, QListView
+from PyQt5.QtGui import QColor, QPen, QPixmap
+from PyQt5.QtCore import Qt, QSize, QRect, QPoint, QAbstractListModel, QModelIndex
+
+from util import *
+from ui.thumbnail_widget import ExifImage
+
+
+THUMB_SIZE   = 100
+THUMB_MARGIN = 2
+
+# default limit of memory held by thumbnail pixmaps (bytes)
+PIXMAP_MEMORY_LIMIT = 128 * 1024 * 1024
+PIXMAP_LOW_WATER    = 0.9               # evict down to 90% of the limit
+
+# extra item data roles
+ImageRole   = Qt.UserRole
+InfoRole    = Qt.UserRole + 1
+ChangedRole = Qt.UserRole + 2
+
+
+
+class ImageCollection:
+    """
+    The images of the browser in display order, with lookups by path and
+    by image that do not scan the list.
+
+    Row numbers are kept in a map that is patched for appends and moves
+    and rebuilt only after bulk changes. A lookup checks the stored row
+    against the order list, so a stale entry can never be returned.
+    """
+    def __init__(self):
+        self.order: List[ExifImage] = []
+        self.by_path: Dict[str, ExifImage] = {}
+        self.rows: Dict[ExifImage, int] = {}
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, row: int) -> ExifImage:
+        return self.order[row]
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def get(self, path: str) -> Optional[ExifImage]:
+        return self.by_path.get(path)
+
+    def row(self, img: ExifImage) -> int:
+        """ Row of an image, -1 if it is not part of the collection. """
+        row = self.rows.get(img)
+        if row is not None and row < len(self.order) and self.order[row] is img:
+            return row
+        if img not in self.rows:
+            return -1
+        self._reindex()
+        return self.rows.get(img, -1)
+
+    def append(self, images: Iterable[ExifImage]):
+        for img in images:
+            self.rows[img] = len(self.order)
+            self.order.append(img)
+            self.by_path[img.path] = img
+
+    def remove(self, images: Iterable[ExifImage]):
+        removed = set(images)
+        self.order[:] = [img for img in self.order if img not in removed]
+        for img in removed:
+            if self.by_path.get(img.path) is img:
+                del self.by_path[img.path]
+        self._reindex()
+
+    def move(self, src: int, dst: int):
+        """ Move the image at row `src` to row `dst`, only the rows in between are renumbered. """
+        img = self.order.pop(src)
+        self.order.insert(dst, img)
+        for row in range(min(src, dst), max(src, dst) + 1):
+            self.rows[self.order[row]] = row
+
+    def set_order(self, images: List[ExifImage]):
+        self.order[:] = images
+        self._reindex()
+
+    def clear(self):
+        self.order.clear()
+        self.by_path.clear()
+        self.rows.clear()
+
+    def _reindex(self):
+        self.rows = {img: row for row, img in enumerate(self.order)}
+
+
+
+def pixmap_bytes(pix: QPixmap) -> int:
+    return 0 if pix.isNull() else pix.width() * pix.height() * pix.depth() // 8
+
+
+
+class PixmapBudget:
+    """
+    Keeps the memory held by thumbnail pixmaps below a limit.
+
+    Once over the limit, the pixmaps of the images farthest from the
+    viewport are dropped. Images within one screen of the viewport are
+    never evicted; evicted ones are reloaded when they come close again.
+    `held`, `evictions` and `reloads` count bytes and pixmaps.
+    """
+    def __init__(self, limit: int=PIXMAP_MEMORY_LIMIT):
+        self.limit = limit
+        self.held = 0
+        self.evictions = 0
+        self.reloads = 0
+        self.evicted: Set[ExifImage] = set()
+        self.reloading: Set[str] = set()
+
+    def set_pixmap(self, img: ExifImage, pix: QPixmap):
+        self.held += pixmap_bytes(pix) - pixmap_bytes(img.pixmap)
+        img.pixmap = pix
+        if img in self.evicted:
+            self.evicted.discard(img)
+            self.reloads += 1
+
+    def evict(self, images: ImageCollection, first: int, last: int) -> int:
+        """ Drop pixmaps farthest from the visible rows `first` .. `last`, returns how many. """
+        if self.held <= self.limit or first < 0:
+            return 0
+        span = last - first + 1
+        keep_first, keep_last = first - span, last + span
+        target = self.limit * PIXMAP_LOW_WATER
+        count = 0
+        lo, hi = 0, len(images) - 1
+        # walk in from both ends, always taking the row farther from the viewport
+        while self.held > target and (lo < keep_first or hi > keep_last):
+            if hi > keep_last and (lo >= keep_first or hi - last >= first - lo):
+                row, hi = hi, hi - 1
+            else:
+                row, lo = lo, lo + 1
+            img = images[row]
+            if img.pixmap.isNull():
+                continue
+            self.held -= pixmap_bytes(img.pixmap)
+            img.pixmap = QPixmap()
+            self.evicted.add(img)
+            count += 1
+        self.evictions += count
+        return count
+
+    def reload_requests(self, images: ImageCollection, first: int, last: int) -> List[ExifImage]:
+        """ Evicted images within one screen of the visible rows that are not reloading yet. """
+        if first < 0 or not self.evicted:
+            return []
+        span = last - first + 1
+        requests = []
+        for row in range(max(first - span, 0), min(last + span, len(images) - 1) + 1):
+            img = images[row]
+            if img in self.evicted and img.path not in self.reloading:
+                self.reloading.add(img.path)
+                requests.append(img)
+        return requests
+
+    def reload_done(self, path: str) -> bool:
+        """ True if `path` was loaded again after an eviction. """
+        if path in self.reloading:
+            self.reloading.discard(path)
+            return True
+        return False
+
+    def forget(self, images: Iterable[ExifImage]):
+        for img in images:
+            self.held -= pixmap_bytes(img.pixmap)
+            self.evicted.discard(img)
+            self.reloading.discard(img.path)
+
+    def clear(self):
+        self.held = 0
+        self.evicted.clear()
+        self.reloading.clear()
+
+
+
+class ThumbnailModel(QAbstractListModel):
+    """
+    List model over the images of the browser, in display order.
+
+    The view only asks for the items it paints, so no widgets are
+    created per image.
+    """
+    def __init__(self, images: ImageCollection, parent=None):
+        super().__init__(parent)
+        self.images = images
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.images)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        img = self.images[index.row()]
+        if role == Qt.DisplayRole:
+            return img.name
+        if role == Qt.DecorationRole:
+            return img.pixmap
+        if role == Qt.ToolTipRole:
+            return img.path if img.save_error is None else f"{img.path}\nSaving failed: {img.save_error}"
+        if role == ImageRole:
+            return img
+        if role == InfoRole:
+            return img.exposure_text()
+        if role == ChangedRole:
+            return img.has_changes()
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemIsDropEnabled
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsDragEnabled
+
+    def append_images(self, images: List[ExifImage]):
+        if not images:
+            return
+        first = len(self.images)
+        self.beginInsertRows(QModelIndex(), first, first + len(images) - 1)
+        self.images.append(images)
+        self.endInsertRows()
+
+    def remove_images(self, images: List[ExifImage]):
+        self.beginResetModel()
+        self.images.remove(images)
+        self.endResetModel()
+
+    def clear(self):
+        self.beginResetModel()
+        self.images.clear()
+        self.endResetModel()
+
+    def set_order(self, images: List[ExifImage]):
+        """ Show the same images in a new order, selection and current item are kept. """
+        self.layoutAboutToBeChanged.emit()
+        old = self.persistentIndexList()
+        moved = [self.images[i.row()] for i in old]
+        self.images.set_order(images)
+        self.changePersistentIndexList(old, [self.index(self.images.row(img)) for img in moved])
+        self.layoutChanged.emit()
+
+    def move_image(self, src: int, dst: int):
+        """ Move the image at row `src` in front of the image at row `dst`. """
+        if src == dst or src + 1 == dst:
+            return
+        self.beginMoveRows(QModelIndex(), src, src, QModelIndex(), dst)
+        self.images.move(src, dst - 1 if src < dst else dst)
+        self.endMoveRows()
+
+    def image_changed(self, img: ExifImage):
+        row = self.images.row(img)
+        if row < 0:
+            return
+        idx = self.index(row)
+        self.dataChanged.emit(idx, idx)
+
+    def some_images_changed(self, images: List[ExifImage]):
+        """ Repaint only the given images, or everything visible if most of them changed. """
+        if len(images) > len(self.images) // 2:
+            self.images_changed()
+            return
+        for img in images:
+            self.image_changed(img)
+
+    def images_changed(self):
+        """ Many images changed, the view repaints what is visible. """
+        if self.images:
+            self.dataChanged.emit(self.index(0), self.index(len(self.images) - 1))
+
+
+
+class ThumbnailDelegate(QStyledItemDelegate):
+    """
+    Paints exposure info, image and file name of a thumbnail in a box,
+    with a red border when the EXIF data was edited and an orange one
+    when saving it failed.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.drop_row = -1      # row highlighted while dragging a frame
+
+    def sizeHint(self, option, index):
+        line = option.fontMetrics.height()
+        return QSize(THUMB_SIZE + 2 * THUMB_MARGIN, THUMB_SIZE + 2 * line + 2 * THUMB_MARGIN)
+
+    def paint(self, painter, option, index):
+        img = index.data(ImageRole)
+        rect = option.rect.adjusted(0, 0, -1, -1)
+        line = option.fontMetrics.height()
+        painter.save()
+
+        if option.state & QStyle.State_Selected or index.row() == self.drop_row:
+            painter.fillRect(rect, QColor('gray'))
+        if img.save_error is not None:
+            border = QColor('orange')
+        elif img.has_changes():
+            border = QColor('red')
+        else:
+            border = QColor('gray')
+        painter.setPen(QPen(border))
+        painter.drawRect(rect)
+
+        painter.setPen(option.palette.color(option.palette.Text))
+        inner = rect.adjusted(THUMB_MARGIN, THUMB_MARGIN, -THUMB_MARGIN, -THUMB_MARGIN)
+        info = option.fontMetrics.elidedText(img.exposure_text(), Qt.ElideRight, inner.width())
+        painter.drawText(QRect(inner.x(), inner.y(), inner.width(), line), Qt.AlignCenter, info)
+
+        pix = img.pixmap
+        if not pix.isNull():
+            x = inner.x() + (inner.width() - pix.width()) // 2
+            y = inner.y() + line + (THUMB_SIZE - pix.height()) // 2
+            painter.drawPixmap(x, y, pix)
+        else:
+            # placeholder until the thumbnail is loaded
+            painter.fillRect(QRect(inner.x(), inner.y() + line, inner.width(), THUMB_SIZE),
+                             option.palette.color(option.palette.AlternateBase))
+
+        name = option.fontMetrics.elidedText(img.name, Qt.ElideRight, inner.width())
+        painter.drawText(QRect(inner.x(), inner.y() + line + THUMB_SIZE, inner.width(), line), Qt.AlignCenter, name)
+        painter.restore()
+
+
+
+def grid_geometry(view: QListView) -> Optional[Tuple[QRect, int, int, int, int]]:
+    """
+    (first item rect, horizontal step, vertical step, columns, lines) of the
+    thumbnail grid, None if it is empty.
+
+    All items have the same size, so every cell follows from the first
+    item's geometry; only the column count needs a binary search over the
+    first line, O(log n) instead of testing every thumbnail.
+    """
+    model = view.model()
+    count = model.rowCount()
+    if count == 0:
+        return None
+
+    first = view.visualRect(model.index(0))
+    spacing = view.spacing()
+
+    # items on the first line
+    lo, hi = 1, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if view.visualRect(model.index(mid)).y() == first.y():
+            lo = mid + 1
+        else:
+            hi = mid
+    columns = lo
+    lines = (count + columns - 1) // columns
+    return first, first.width() + 2 * spacing, first.height() + 2 * spacing, columns, lines
+
+
+def visible_rows(view: QListView) -> Tuple[int, int]:
+    """ First and last row shown in the viewport, (-1, -1) if the grid is empty. """
+    geometry = grid_geometry(view)
+    if geometry is None:
+        return -1, -1
+    first, _, step_y, columns, lines = geometry
+    spacing = view.spacing()
+    top = (view.viewport().rect().top() - first.y() + spacing) // step_y
+    bottom = (view.viewport().rect().bottom() - first.y() + spacing) // step_y
+    top = min(max(top, 0), lines - 1)
+    bottom = min(max(bottom, 0), lines - 1)
+    count = view.model().rowCount()
+    return top * columns, min((bottom + 1) * columns, count) - 1
+
+
+def grid_slot(view: QListView, pos: QPoint) -> Tuple[int, int, QRect]:
+    """
+    Map a viewport position to the thumbnail grid.
+
+    Returns the row of the item under `pos` (-1 over a gap or empty
+    space), the row an image dropped there is inserted before (-1 if the
+    grid is empty) and the rect of the insertion marker.
+    """
+    geometry = grid_geometry(view)
+    if geometry is None:
+        return -1, -1, QRect()
+    first, step_x, step_y, columns, lines = geometry
+    model = view.model()
+    count = model.rowCount()
+    spacing = view.spacing()
+
+    col = min(max((pos.x() - first.x() + spacing) // step_x, 0), columns - 1)
+    line = min(max((pos.y() - first.y() + spacing) // step_y, 0), lines - 1)
+    row = min(line * columns + col, count - 1)
+
+    if pos.y() > first.y() + lines * step_y:
+        # below the last line, append
+        row = count - 1
+
+    rect = view.visualRect(model.index(row))
+    hit = row if rect.contains(pos) else -1
+    # marker on the left edge if inserting before, else on the right edge, centered in the gap
+    if pos.x() < rect.center().x() and pos.y() <= rect.bottom() + spacing:
+        insert, x = row, rect.x() - spacing
+    else:
+        insert, x = row + 1, rect.right() + 1 + spacing
+    return hit, insert, QRect(x - 2, rect.y(), 4, rect.height())
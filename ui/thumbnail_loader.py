@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+#
+
+import io
+import os
+import stat
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from PIL import Image, ExifTags
+from PyQt5.QtGui import QImage, QImageReader
+from PyQt5.QtCore import Qt, QSize
+
+from util import *
+from exifreader import read_metadata
+
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.gif')
+
+# EXIF tags the image browser reads from each file
+IMAGE_EXIF_TAGS = set(VISIBLE_EXIF_TAGS) | {
+    0x0132,                             # DateTime
+    0x9003,                             # DateTimeOriginal
+    ExifTagNames.ImageNumber.value,
+    ExifTagNames.UserComment.value,
+    ExifTagNames.ExposureMode.value,
+    ExifTagNames.MeteringMode.value,
+    ExifTagNames.Flash.value,
+}
+
+# IFD1 tags pointing to the embedded JPEG thumbnail
+JPEG_INTERCHANGE_FORMAT        = 0x0201
+JPEG_INTERCHANGE_FORMAT_LENGTH = 0x0202
+
+# TIFF tags describing the pixel layout
+BITS_PER_SAMPLE   = 0x0102
+SAMPLES_PER_PIXEL = 0x0115
+
+# default limit of decoded pixel data held by all loader threads together (bytes)
+DECODE_MEMORY_LIMIT = 1024 * 1024 * 1024
+# uncompressed TIFFs larger than this are read in bands instead of at once (bytes)
+BANDED_DECODE_SIZE  = 64 * 1024 * 1024
+# decoded size of one band (bytes)
+BAND_SIZE           = 8 * 1024 * 1024
+
+
+
+class MemoryBudget:
+    """
+    Bytes of decoded image data the loader threads may hold at once.
+
+    A decode waits until its size fits into what is left of the limit.
+    If nothing else is running it starts anyway, so a single image larger
+    than the limit is still loaded, just never next to another one.
+    """
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.cond = threading.Condition()
+
+    def set_limit(self, limit: int):
+        with self.cond:
+            self.limit = limit
+            self.cond.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes: int):
+        with self.cond:
+            while self.used and self.used + nbytes > self.limit:
+                self.cond.wait()
+            self.used += nbytes
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.used -= nbytes
+                self.cond.notify_all()
+
+
+# shared by all loader threads
+decode_budget = MemoryBudget(DECODE_MEMORY_LIMIT)
+
+
+
+def exif_thumbnail(img: Image.Image, size: Tuple[int, int]) -> Optional[Image.Image]:
+    """
+    Embedded EXIF thumbnail of an image, if it has one that is at
+    least as large as the requested size. Only a few KB are decoded.
+    """
+    raw = img.info.get('exif')
+    if not raw:
+        return None
+    try:
+        ifd1 = img.getexif().get_ifd(ExifTags.IFD.IFD1)
+        offset = ifd1.get(JPEG_INTERCHANGE_FORMAT)
+        length = ifd1.get(JPEG_INTERCHANGE_FORMAT_LENGTH)
+        if not offset or not length:
+            return None
+        # offsets are relative to the TIFF header behind the "Exif\0\0" marker
+        start = 6 + offset if raw.startswith(b'Exif\x00\x00') else offset
+        thumb = Image.open(io.BytesIO(raw[start:start + length]))
+        thumb.load()
+    except Exception:
+        return None
+
+    if thumb.width < size[0] and thumb.height < size[1]:
+        return None
+    thumb.thumbnail(size)
+    return thumb
+
+
+def decoded_size(img: Image.Image) -> int:
+    """ Memory Pillow needs for the pixels of an image at its current size. """
+    if img.mode in ('1', 'L', 'P'):
+        bpp = 1
+    elif img.mode.startswith('I;16'):
+        bpp = 2
+    else:
+        bpp = 4
+    return img.width * img.height * bpp
+
+
+def to_8bit(img: Image.Image) -> Image.Image:
+    """ 16/32 bit grayscale scaled down to 8 bit, other modes are returned as they are. """
+    if img.mode.startswith('I'):
+        return img.convert('I').point(lambda i: i * (1 / 256)).convert('L')
+    return img
+
+
+def banded_tiff_layout(img: Image.Image) -> Optional[Tuple[List[int], int, int, str]]:
+    """
+    (strip offsets, rows per strip, bytes per row, raw mode) of an uncompressed,
+    interleaved TIFF in strips, None for any other layout.
+    """
+    if img.format != 'TIFF' or getattr(img, 'use_load_libtiff', True) or not img.tile:
+        return None
+    if any(t[0] != 'raw' or t[1][0] != 0 or t[1][2] != img.width for t in img.tile):
+        # compressed, tiled or one plane per channel
+        return None
+    rawmode = img.tile[0][3][0]
+    if any(t[3][0] != rawmode for t in img.tile):
+        return None
+    bits = img.tag_v2.get(BITS_PER_SAMPLE, (1,))
+    if not isinstance(bits, tuple):
+        bits = (bits,)
+    if len(bits) == 1:
+        bits = bits * img.tag_v2.get(SAMPLES_PER_PIXEL, 1)
+    rows_per_strip = img.tile[0][1][3] - img.tile[0][1][1]
+    return [t[2] for t in img.tile], rows_per_strip, (img.width * sum(bits) + 7) // 8, rawmode
+
+
+def banded_tiff(img: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    """
+    Reduce an uncompressed TIFF band by band, straight from its strips.
+    Only one band of full resolution rows and the reduced image are held
+    in memory, whatever the size of the scan.
+    """
+    offsets, rows_per_strip, row_bytes, rawmode = banded_tiff_layout(img)
+    width, height = img.size
+    # reduce to twice the target size, thumbnail() resamples the rest
+    factor = max(1, min(width // (2 * size[0]), height // (2 * size[1])))
+    rows = max(factor, BAND_SIZE // max(row_bytes, 1) // factor * factor)
+
+    reduced = None
+    for y in range(0, height, rows):
+        n = min(rows, height - y)
+        data = bytearray()
+        row = y
+        while row < y + n:
+            strip, skip = divmod(row, rows_per_strip)
+            take = min(y + n - row, rows_per_strip - skip)
+            img.fp.seek(offsets[strip] + skip * row_bytes)
+            data += img.fp.read(take * row_bytes)
+            row += take
+        band = to_8bit(Image.frombytes(img.mode, (width, n), data, 'raw', rawmode))
+        band = band.reduce(factor)
+        if reduced is None:
+            reduced = Image.new(band.mode, (-(-width // factor), -(-height // factor)))
+        reduced.paste(band, (0, y // factor))
+
+    reduced.thumbnail(size)
+    return reduced
+
+
+def reduced_image(img: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    """
+    Decode an image close to the requested size.
+
+    JPEGs are scaled by libjpeg in the DCT domain (1/2 .. 1/8), TIFFs with
+    reduced resolution pages use the smallest page that is still large
+    enough, large uncompressed TIFFs are reduced band by band. Everything
+    else is reduced by block averaging before resampling.
+
+    Decodes wait for their share of the decode memory budget.
+    """
+    if img.format == 'JPEG':
+        img.draft(img.mode, size)
+
+    elif img.format == 'TIFF' and getattr(img, 'n_frames', 1) > 1:
+        best, best_area = 0, img.width * img.height
+        for i in range(img.n_frames):
+            img.seek(i)
+            if img.width >= size[0] and img.height >= size[1] and img.width * img.height < best_area:
+                best, best_area = i, img.width * img.height
+        img.seek(best)
+
+    if decoded_size(img) > BANDED_DECODE_SIZE and banded_tiff_layout(img):
+        # one band of raw and converted rows plus the reduced image
+        with decode_budget.reserve(3 * BAND_SIZE):
+            return banded_tiff(img, size)
+
+    with decode_budget.reserve(decoded_size(img)):
+        img.thumbnail(size, reducing_gap=2.0)
+    return img
+
+
+def pil_to_qimage(img: Image.Image) -> QImage:
+    img = to_8bit(img)
+    if img.mode == 'RGBA':
+        data, fmt, bpp = img.tobytes(), QImage.Format_RGBA8888, 4
+    else:
+        img = img.convert('RGB')
+        data, fmt, bpp = img.tobytes(), QImage.Format_RGB888, 3
+    # copy, so the QImage owns its pixels
+    return QImage(data, img.width, img.height, img.width * bpp, fmt).copy()
+
+
+def read_exif(img: Image.Image) -> Dict[int, Any]:
+    """ IFD0 and Exif IFD tags of an opened image, for JPEGs as well as TIFFs and PNGs. """
+    if hasattr(img, '_getexif'):
+        return img._getexif() or {}
+    exif = img.getexif()
+    tags = dict(exif)
+    tags.update(exif.get_ifd(ExifTags.IFD.Exif))
+    return tags
+
+
+def thumbnail_image(img: Image.Image, size: QSize) -> QImage:
+    target = (size.width(), size.height())
+    thumb = exif_thumbnail(img, target)
+    if thumb is None:
+        thumb = reduced_image(img, target)
+    return pil_to_qimage(thumb)
+
+
+def qt_thumbnail(path: str, size: QSize) -> QImage:
+    """ Fallback for files Pillow cannot read, Qt scales while decoding. """
+    reader = QImageReader(path)
+    if reader.size().isValid():
+        reader.setScaledSize(reader.size().scaled(size, Qt.KeepAspectRatio))
+    return reader.read()
+
+
+def load_thumbnail(path: str, size: QSize) -> QImage:
+    """ Thumbnail of an image file, decoded at reduced resolution where possible. """
+    try:
+        with Image.open(path) as img:
+            return thumbnail_image(img, size)
+    except Exception as e:
+        logger.debug(f"Reduced decoding failed for {path}: {e}")
+    return qt_thumbnail(path, size)
+
+
+
+class ImageRecord:
+    """
+    Everything the image browser needs about one file, read by a worker
+    so the GUI thread does not touch the file system.
+    """
+    def __init__(self, path: str, st: os.stat_result, exif: Dict[int, Any], image: QImage):
+        self.path      = path
+        self.name      = os.path.basename(path)
+        self.stat      = st
+        self.file_date = st.st_mtime
+        self.exif      = exif
+        self.image     = image
+
+
+def read_image(path: str, size: QSize) -> ImageRecord:
+    """
+    Open an image file once and read its stat info, the EXIF tags the
+    browser uses and a reduced resolution thumbnail from the same handle.
+    """
+    exif, qimg = {}, None
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        try:
+            with Image.open(f) as img:
+                exif = {t: v for t, v in read_exif(img).items() if t in IMAGE_EXIF_TAGS}
+                qimg = thumbnail_image(img, size)
+        except Exception as e:
+            logger.debug(f"Reduced decoding failed for {path}: {e}")
+    if qimg is None:
+        qimg = qt_thumbnail(path, size)
+    return ImageRecord(path, st, exif, qimg)
+
+
+def read_image_info(path: str, st: Optional[os.stat_result]=None) -> ImageRecord:
+    """
+    Stat info and EXIF tags of an image, without any pixel data.
+    JPEGs and TIFFs only have their EXIF block parsed, other formats
+    go through Pillow, which reads the header only.
+    """
+    if st is None:
+        st = os.stat(path)
+    exif = read_metadata(path, IMAGE_EXIF_TAGS)
+    if exif is None:
+        try:
+            with Image.open(path) as img:
+                exif = {t: v for t, v in read_exif(img).items() if t in IMAGE_EXIF_TAGS}
+        except Exception as e:
+            logger.debug(f"No EXIF data for {path}: {e}")
+            exif = {}
+    return ImageRecord(path, st, exif, QImage())
+
+
+
+def scan_images(paths: Iterable[str], recursive: bool=False) -> Iterator[Tuple[str, os.stat_result]]:
+    """
+    Image files among `paths` and inside the folders among them, with their
+    stat info. Folders are listed with os.scandir and their images yielded
+    while the scan goes on, sorted by name per folder. Symlinked folders are
+    not followed, so a link cycle cannot make the scan run forever.
+    """
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            logger.error(f"Cannot open {path}: {e}")
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            yield from _scan_folder(path, recursive)
+        elif path.lower().endswith(IMAGE_EXTS):
+            yield path, st
+
+
+def _scan_folder(folder: str, recursive: bool) -> Iterator[Tuple[str, os.stat_result]]:
+    folders = [folder]
+    while folders:
+        current = folders.pop()
+        files: List[os.DirEntry] = []
+        subfolders: List[str] = []
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                subfolders.append(entry.path)
+                        elif entry.name.lower().endswith(IMAGE_EXTS) and entry.is_file():
+                            files.append(entry)
+                    except OSError as e:
+                        logger.debug(f"Skipping {entry.path}: {e}")
+        except OSError as e:
+            logger.error(f"Cannot list {current}: {e}")
+            continue
+
+        for entry in sorted(files, key=lambda e: e.name):
+            try:
+                yield entry.path, entry.stat()
+            except OSError as e:
+                logger.debug(f"Skipping {entry.path}: {e}")
+        # depth first, subfolders in name order
+        folders.extend(sorted(subfolders, reverse=True))
@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 #
 
+import os
 import math
+import shutil
+import secrets
+from contextlib import contextmanager
 from aenum import Enum
 from typing import Dict, List, Any
 
@@ -131,6 +135,19 @@ def format_exposure_time(val: Any) -> str:
     return f"1/{denom}"
 
 
+def format_focal_length(val: Any) -> str:
+    if isinstance(val, float) and math.isnan(val):
+        return "Unknown"
+    return f"{val} mm"
+
+
+def sort_key(val: Any):
+    """ Sort numbers numerically and everything else after them as text. """
+    if isinstance(val, (int, float)) and not (isinstance(val, float) and math.isnan(val)):
+        return (0, val, "")
+    return (1, 0, "" if val is None else str(val))
+
+
 def print_rolls_summary(all_rolls: List[Dict[str,Any]]):
     print("\n=== Rolls Summary ===")
     print(f"{'Roll':>6}  {'ISO':>4}  {'Frames':>6}")
@@ -168,6 +185,34 @@ class ExifTagNames(Enum):
 
 
 
+@contextmanager
+def atomic_write(path: str, mode: str='w', **kwargs):
+    """
+    Open a temporary file next to `path` and move it into place once the
+    block finished successfully, so readers never see a half written file.
+    The data is on disk before the rename and an existing file keeps its
+    permissions.
+    """
+    folder, name = os.path.split(os.path.abspath(path))
+    tmp = os.path.join(folder, f".{name}.{secrets.token_hex(4)}.tmp")
+    access = os.O_RDWR if '+' in mode else os.O_WRONLY
+    fd = os.open(tmp, access | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
 def load_svg_icon(path: str, size: QSize, color: QColor) -> QIcon:
     """
     Load an SVG file and color it before converting to QIcon.